@@ -0,0 +1,154 @@
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import freeze_support
+
+# Leistungsmessung von LSControlling mit synthetischen SAP Exporten (siehe sap_generator.py). Für jede Größe
+# (Anzahl PSP-Elemente) werden die Exporte erzeugt und der komplette Lauf (Import und Berichte) in einem eigenen
+# Prozess ausgeführt, damit Laufzeiten und Speicherbedarf nicht von vorherigen Läufen beeinflusst werden. Gemessen
+# werden die Laufzeiten aller LogContext Schritte, der Durchsatz und der maximale Speicherbedarf.
+
+
+# Maximalen Speicherbedarf des aktuellen Prozesses in MB ermitteln (unter Windows steht resource nicht zur Verfügung,
+# dort wird über tracemalloc nur der Speicher der Python-Objekte erfasst)
+def spitzen_speicher_mb():
+    if os.name == 'nt':
+        import tracemalloc
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024 if tracemalloc.is_tracing() else None
+
+    import resource
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024 / 1024 if sys.platform == 'darwin' else maxrss / 1024  # macOS in Byte, sonst in kB
+
+
+# Einen vollständigen Lauf für die Exporte im Verzeichnis messen (läuft in einem eigenen Prozess)
+def lauf_messen(verzeichnis, anzahl_ikz, ausgabe, prozesse):
+    if os.name == 'nt':
+        import tracemalloc
+        tracemalloc.start()
+
+    from funktionen import LSControllingConfig, LogContext, import_sap_csv
+    from lscontrolling import berichte_erzeugen, batch_berichte_erzeugen
+    from sap_generator import dateinamen
+
+    cfg = LSControllingConfig()
+    for d, name in dateinamen.items():
+        cfg.setzen(f'csv_{d}', os.path.join(verzeichnis, 'input', name))
+    cfg.setzen('csv_detailplot', os.path.join(verzeichnis, 'input', 'PSP_PLOT.csv'))
+    cfg.setzen('cache_verzeichnis', os.path.join(verzeichnis, 'cache'))
+    cfg.setzen('batch_verzeichnis', os.path.join(verzeichnis, 'output'))
+    cfg.setzen('batch_modus', anzahl_ikz > 1)
+    cfg.setzen('diagramm_cache', False)
+    cfg.setzen('ausgabe', ausgabe)
+    cfg.setzen('parallel_prozesse', prozesse)
+
+    LogContext.aktiv = False
+    LogContext.protokoll = []
+    start = time.time()
+    with LogContext("Datenimport und -bereinigung"):
+        ikz, df, rep_dates = import_sap_csv(cfg)
+    if anzahl_ikz > 1:
+        batch_berichte_erzeugen(cfg, df, rep_dates)
+    else:
+        berichte_erzeugen(cfg, ikz, df, rep_dates, verzeichnis)
+    gesamt = time.time() - start
+
+    # nur die äußeren Schritte berücksichtigen (die Sub-Berichte einzeln wären zu unübersichtlich)
+    schritte = dict()
+    for eintrag in LogContext.protokoll:
+        if eintrag['ebene'] == 0:
+            schritte[eintrag['schritt']] = schritte.get(eintrag['schritt'], 0) + eintrag['laufzeit_s']
+
+    return {
+        'zeilen': len(df),
+        'psp': df['PSP'].nunique(),
+        'gesamt': gesamt,
+        'schritte': schritte,
+        'speicher_mb': spitzen_speicher_mb()
+    }
+
+
+# Regressionsprüfung des inkrementellen Imports mit synthetischen Exporten: beim ersten Lauf, bei unveränderten und bei
+# geänderten Exporten (anderer Startwert) muss dasselbe Ergebnis entstehen wie beim vollständigen Import. Abweichungen
+# werden als AssertionError ausgelöst.
+def inkrementell_pruefen(verzeichnis, anzahl_psp, anzahl_jahre, anzahl_ikz):
+    import pandas as pd
+    from funktionen import LSControllingConfig, LogContext, import_sap_csv
+    from sap_generator import sap_exporte_erzeugen
+
+    LogContext.aktiv = False
+    cfg = LSControllingConfig()
+    cfg.setzen('cache_verzeichnis', os.path.join(verzeichnis, 'cache'))
+    cfg.setzen('batch_modus', anzahl_ikz > 1)
+    for seed, fall in [(1, "erster Lauf"), (1, "unveränderte Exporte"), (2, "geänderte Exporte")]:
+        pfade = sap_exporte_erzeugen(os.path.join(verzeichnis, 'input'), anzahl_psp, anzahl_jahre, anzahl_ikz,
+                                     seed=seed)
+        for d, pfad in pfade.items():
+            cfg.setzen(f'csv_{d}', pfad)
+        cfg.setzen('inkrementell', False)
+        erwartet = import_sap_csv(cfg)[1]
+        cfg.setzen('inkrementell', True)
+        pd.testing.assert_frame_equal(import_sap_csv(cfg)[1], erwartet)
+        print(f"Inkrementeller Import ({fall}): OK")
+
+
+def ergebnis_ausgeben(anzahl_psp, messung):
+    print(f"\n{anzahl_psp} PSP-Elemente ({messung['psp']} im Bericht, {messung['zeilen']} Zeilen nach dem Import)")
+    for schritt, sekunden in messung['schritte'].items():
+        print(f"  {schritt:<60} {sekunden:8.2f} s")
+    import_zeit = messung['schritte'].get("Datenimport und -bereinigung", 0)
+    speicher = f"{messung['speicher_mb']:.0f} MB" if messung['speicher_mb'] is not None else "k.A."
+    print(f"  {'Gesamt':<60} {messung['gesamt']:8.2f} s")
+    print(f"  Durchsatz Import: {messung['zeilen'] / import_zeit if import_zeit else 0:.0f} Zeilen/s, "
+          f"gesamt: {messung['psp'] / messung['gesamt']:.0f} PSP-Elemente/s, maximaler Speicher: {speicher}")
+
+
+if __name__ == "__main__":
+    freeze_support()
+
+    parser = argparse.ArgumentParser(description="Leistungsmessung von LSControlling mit synthetischen SAP Exporten")
+    parser.add_argument('--psp', type=int, nargs='+', default=[250, 1000, 4000],
+                        help="Anzahl der PSP-Elemente je Messung (Standard: 250 1000 4000)")
+    parser.add_argument('--jahre', type=int, default=15, help="Anzahl der Jahre (Standard: 15)")
+    parser.add_argument('--ikz', type=int, default=1, help="Anzahl der IKZ (mehr als 1 nutzt den Batch-Modus)")
+    parser.add_argument('--ausgabe', default='txt, pdf, csv', help="zu erzeugende Ausgaben (Standard: txt, pdf, csv)")
+    parser.add_argument('--prozesse', type=int, default=0, help="Prozesse für die Sub-Berichte (Standard: 0 = alle)")
+    parser.add_argument('--csv', help="Ergebnisse zusätzlich in diese CSV-Datei schreiben")
+    parser.add_argument('--verzeichnis', help="Arbeitsverzeichnis (Standard: temporäres Verzeichnis)")
+    parser.add_argument('--pruefen', action='store_true',
+                        help="statt der Messung den inkrementellen Import mit dem vollständigen vergleichen")
+    args = parser.parse_args()
+
+    if args.pruefen:
+        with tempfile.TemporaryDirectory() as tmp:
+            for anzahl_psp in args.psp:
+                inkrementell_pruefen(os.path.join(args.verzeichnis or tmp, f"pruefung_{anzahl_psp}"), anzahl_psp,
+                                     args.jahre, args.ikz)
+        sys.exit(0)
+
+    from sap_generator import sap_exporte_erzeugen
+
+    ergebnisse = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for anzahl_psp in args.psp:
+            verzeichnis = os.path.join(args.verzeichnis or tmp, f"psp_{anzahl_psp}")
+            sap_exporte_erzeugen(os.path.join(verzeichnis, 'input'), anzahl_psp, args.jahre, args.ikz)
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                messung = pool.submit(lauf_messen, verzeichnis, args.ikz, args.ausgabe, args.prozesse).result()
+            ergebnis_ausgeben(anzahl_psp, messung)
+            ergebnisse.append((anzahl_psp, messung))
+
+    if args.csv:
+        schritte = list(dict.fromkeys(s for _, m in ergebnisse for s in m['schritte']))
+        with open(args.csv, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(['PSP-Elemente', 'Zeilen', 'Gesamt [s]', 'Speicher [MB]'] + [f"{s} [s]" for s in schritte])
+            for anzahl_psp, m in ergebnisse:
+                speicher = f"{m['speicher_mb']:.1f}" if m['speicher_mb'] is not None else ''
+                writer.writerow([anzahl_psp, m['zeilen'], f"{m['gesamt']:.3f}", speicher] +
+                                [f"{m['schritte'].get(s, 0):.3f}" for s in schritte])
+        print(f"\nErgebnisse in {args.csv} geschrieben")
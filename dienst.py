@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from email import policy
+from email.parser import BytesParser
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import freeze_support
+from urllib.parse import parse_qs, urlsplit
+from funktionen import LSControllingConfig, LogContext, ausgabeformate, import_sap_csv_cached
+from version import program_version
+
+# HTTP-Dienst für LSControlling (nur Standardbibliothek), z.B. zur Anbindung an ein internes Portal. Eine Anfrage
+# POST /berichte enthält die vier SAP Exporte als Upload (multipart/form-data mit den Feldern stammdaten, budget,
+# obligo, kst und optional detailplot) oder als JSON mit Dateipfaden auf dem Server. Jede Anfrage ist ein Auftrag mit
+# eigenem Verzeichnis, der in einem Prozesspool ausgeführt wird, so dass mehrere Anfragen gleichzeitig bearbeitet
+# werden. Import- und Diagrammcache liegen im gemeinsamen cache_verzeichnis und werden von allen Aufträgen genutzt.
+# Die Antwort listet die erzeugten Dateien, die über GET /auftraege/<auftrag>/<datei> blockweise abgerufen werden.
+
+quellen = ['stammdaten', 'budget', 'obligo', 'kst']
+
+# Content-Type der Ausgaben (CSV-Dateien werden wie bei write_csv in cp1252 geschrieben)
+medientypen = {
+    '.pdf': 'application/pdf',
+    '.txt': 'text/plain; charset=utf-8',
+    '.csv': 'text/csv; charset=cp1252',
+    '.json': 'application/json'
+}
+
+
+# Einen Auftrag im Prozesspool bearbeiten: Import (mit gemeinsamem Cache) und Berichte im Auftragsverzeichnis, im
+# Batch-Modus für alle IKZ. Rückgabe: IKZ (im Batch-Modus Liste der IKZ)
+def auftrag_bearbeiten(cfg, verzeichnis):
+    from lscontrolling import berichte_erzeugen, batch_berichte_erzeugen
+
+    LogContext.aktiv = False
+    LogContext.konfigurieren(cfg, os.path.join(verzeichnis, 'Profil.prof'))
+    ikz, df_ikz, rep_dates = import_sap_csv_cached(cfg)
+    if cfg['batch_modus']:
+        cfg.setzen('batch_verzeichnis', verzeichnis)
+        fehler = batch_berichte_erzeugen(cfg, df_ikz, rep_dates)
+        if fehler:
+            raise Exception(f"Für die IKZ {', '.join(sorted(fehler))} konnten keine Berichte erzeugt werden")
+    else:
+        berichte_erzeugen(cfg, ikz, df_ikz, rep_dates, verzeichnis, prozesse=1)
+    if cfg['messbericht']:
+        LogContext.messbericht_schreiben(os.path.join(verzeichnis, f"Messung.{cfg['messbericht']}"))
+    return ikz
+
+
+class Dienst(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config_file='config.ini', adresse=None):
+        self.config_file = config_file
+        cfg = LSControllingConfig(config_file)
+        self.verzeichnis = cfg['dienst_verzeichnis']
+        self.aufbewahrung_s = cfg['dienst_aufbewahrung'] * 3600
+        self.max_bytes = cfg['dienst_max_mb'] * 1024 * 1024
+        self.prozesse = cfg['dienst_prozesse'] or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(max_workers=self.prozesse)
+        self.laufend = 0
+        self.sperre = threading.Lock()
+        os.makedirs(self.verzeichnis, exist_ok=True)
+        super().__init__(adresse or (cfg['dienst_host'], cfg['dienst_port']), DienstAnfrage)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown()
+
+    # Verzeichnisse von Aufträgen löschen, die älter als dienst_aufbewahrung Stunden sind
+    def aufraeumen(self):
+        grenze = time.time() - self.aufbewahrung_s
+        for auftrag in os.listdir(self.verzeichnis):
+            pfad = os.path.join(self.verzeichnis, auftrag)
+            try:
+                if os.path.isdir(pfad) and os.stat(pfad).st_mtime < grenze:
+                    shutil.rmtree(pfad, ignore_errors=True)
+            except FileNotFoundError:
+                pass
+
+    # Auftrag anlegen: Verzeichnis erzeugen, Uploads ablegen bzw. Pfade übernehmen und die Config des Auftrags
+    # erstellen. Fehler in der Anfrage werden als ValueError gemeldet. Rückgabe: Auftrag, Verzeichnis und Config
+    def auftrag_anlegen(self, content_type, body, parameter):
+        cfg = LSControllingConfig(self.config_file)
+        # Aufträge laufen gleichzeitig und würden sich den Zustand des inkrementellen Imports für dieselbe IKZ
+        # gegenseitig überschreiben (der Import-Cache wird weiter genutzt)
+        cfg.setzen('inkrementell', False)
+        if 'ausgabe' in parameter:
+            cfg.setzen('ausgabe', parameter['ausgabe'][-1])
+        try:
+            ausgabeformate(cfg['ausgabe'])
+        except Exception as e:
+            raise ValueError(str(e))
+
+        auftrag = uuid.uuid4().hex
+        verzeichnis = os.path.join(self.verzeichnis, auftrag)
+        os.makedirs(os.path.join(verzeichnis, 'input'))
+        try:
+            if content_type.startswith('multipart/form-data'):
+                pfade = self.uploads_ablegen(content_type, body, os.path.join(verzeichnis, 'input'))
+            elif content_type.startswith('application/json'):
+                try:
+                    pfade = json.loads(body)
+                except ValueError:
+                    raise ValueError("Der Inhalt der Anfrage ist kein gültiges JSON")
+                if not isinstance(pfade, dict):
+                    raise ValueError("Erwartet wird ein JSON-Objekt mit den Pfaden der SAP Exporte")
+                for d, pfad in pfade.items():
+                    if d in quellen and not os.path.isfile(str(pfad)):
+                        raise ValueError(f"Die Datei {pfad} für '{d}' existiert nicht")
+            else:
+                raise ValueError("Erwartet wird multipart/form-data (Upload) oder application/json (Pfade)")
+
+            fehlend = [d for d in quellen if d not in pfade]
+            if fehlend:
+                raise ValueError(f"Es fehlen die SAP Exporte: {', '.join(fehlend)}")
+        except ValueError:
+            shutil.rmtree(verzeichnis, ignore_errors=True)
+            raise
+
+        for d in quellen:
+            cfg.setzen(f'csv_{d}', pfade[d])
+        # ohne Angabe keine Detailplots (nicht die Datei aus dem Arbeitsverzeichnis des Dienstes verwenden)
+        cfg.setzen('csv_detailplot', pfade.get('detailplot', os.path.join(verzeichnis, 'input', 'PSP_PLOT.csv')))
+        return auftrag, verzeichnis, cfg
+
+    # Dateien aus einem multipart/form-data Upload im Verzeichnis ablegen. Rückgabe: Dictionary Feldname -> Pfad
+    @staticmethod
+    def uploads_ablegen(content_type, body, verzeichnis):
+        nachricht = BytesParser(policy=policy.HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+        if not nachricht.is_multipart():
+            raise ValueError("Der Upload enthält keine Dateien")
+        pfade = dict()
+        for teil in nachricht.iter_parts():
+            feld = teil.get_param('name', header='content-disposition')
+            if feld not in quellen + ['detailplot']:
+                continue
+            pfade[feld] = os.path.join(verzeichnis, f"{feld}.csv")
+            with open(pfade[feld], 'wb') as f:
+                f.write(teil.get_payload(decode=True) or b'')
+        return pfade
+
+
+class DienstAnfrage(BaseHTTPRequestHandler):
+    server_version = f"LSControlling/{program_version}"
+    blockgroesse = 256 * 1024
+
+    def json_senden(self, status, daten):
+        inhalt = json.dumps(daten, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(inhalt)))
+        self.end_headers()
+        self.wfile.write(inhalt)
+
+    def fehler_senden(self, status, meldung):
+        self.json_senden(status, {'fehler': meldung})
+
+    def do_GET(self):
+        pfad = urlsplit(self.path).path
+        if pfad == '/status':
+            self.json_senden(HTTPStatus.OK, {'version': program_version, 'prozesse': self.server.prozesse,
+                                             'laufend': self.server.laufend})
+            return
+
+        teile = pfad.strip('/').split('/', 2)
+        if len(teile) == 3 and teile[0] == 'auftraege':
+            self.datei_senden(teile[1], teile[2])
+        else:
+            self.fehler_senden(HTTPStatus.NOT_FOUND, f"Unbekannter Pfad {pfad}")
+
+    # Ausgabedatei eines Auftrags blockweise senden (nur Dateien innerhalb des Auftragsverzeichnisses)
+    def datei_senden(self, auftrag, name):
+        basis = os.path.realpath(os.path.join(self.server.verzeichnis, auftrag))
+        datei = os.path.realpath(os.path.join(basis, name))
+        if os.path.commonpath([basis, datei]) != basis or not os.path.isfile(datei):
+            self.fehler_senden(HTTPStatus.NOT_FOUND, f"Datei {name} für Auftrag {auftrag} nicht gefunden")
+            return
+
+        with open(datei, 'rb') as f:
+            self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Type', medientypen.get(os.path.splitext(datei)[1], 'application/octet-stream'))
+            self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+            self.send_header('Content-Disposition', f'attachment; filename="{os.path.basename(datei)}"')
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile, self.blockgroesse)
+
+    def do_POST(self):
+        adresse = urlsplit(self.path)
+        if adresse.path != '/berichte':
+            self.fehler_senden(HTTPStatus.NOT_FOUND, f"Unbekannter Pfad {adresse.path}")
+            return
+
+        laenge = int(self.headers.get('Content-Length') or 0)
+        if laenge > self.server.max_bytes:
+            self.fehler_senden(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                               f"Die Anfrage ist größer als {self.server.max_bytes // 1024 // 1024} MB")
+            return
+
+        self.server.aufraeumen()
+        try:
+            auftrag, verzeichnis, cfg = self.server.auftrag_anlegen(self.headers.get('Content-Type', ''),
+                                                                    self.rfile.read(laenge), parse_qs(adresse.query))
+        except ValueError as e:
+            self.fehler_senden(HTTPStatus.BAD_REQUEST, str(e))
+            return
+
+        start = time.time()
+        with self.server.sperre:
+            self.server.laufend += 1
+        try:
+            ikz = self.server.pool.submit(auftrag_bearbeiten, cfg, verzeichnis).result()
+        except Exception as e:
+            self.fehler_senden(HTTPStatus.UNPROCESSABLE_ENTITY, str(e))
+            return
+        finally:
+            with self.server.sperre:
+                self.server.laufend -= 1
+
+        dateien = []
+        for ordner, _, namen in os.walk(verzeichnis):
+            for name in sorted(namen):
+                pfad = os.path.join(ordner, name)
+                relativ = os.path.relpath(pfad, verzeichnis).replace(os.sep, '/')
+                if relativ.startswith('input/') or os.path.splitext(name)[1] not in medientypen:
+                    continue
+                dateien.append({'name': relativ, 'url': f"/auftraege/{auftrag}/{relativ}",
+                                'bytes': os.path.getsize(pfad)})
+        self.json_senden(HTTPStatus.OK, {'auftrag': auftrag, 'ikz': ikz, 'laufzeit_s': round(time.time() - start, 3),
+                                         'dateien': dateien})
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} - {format % args}")
+
+
+if __name__ == "__main__":
+    # notwendig für den Prozesspool, wenn das Programm mit PyInstaller kompiliert wurde
+    freeze_support()
+
+    parser = argparse.ArgumentParser(description="LSControlling als lokalen HTTP-Dienst starten")
+    parser.add_argument('--config', default='config.ini', help="Pfad zur Config-Datei (Standard: config.ini)")
+    parser.add_argument('--host', help="Adresse (Standard: dienst_host aus der Config, 127.0.0.1)")
+    parser.add_argument('--port', type=int, help="Port (Standard: dienst_port aus der Config, 8080)")
+    args = parser.parse_args()
+
+    cfg = LSControllingConfig(args.config)
+    dienst = Dienst(args.config, (args.host or cfg['dienst_host'], args.port or cfg['dienst_port']))
+    print(f"LSControlling Dienst auf http://{dienst.server_address[0]}:{dienst.server_address[1]} "
+          f"mit {dienst.prozesse} Prozessen (beenden mit Strg+C)")
+    try:
+        dienst.serve_forever()
+    except KeyboardInterrupt:
+        print("\nDienst beendet.")
+    finally:
+        dienst.server_close()
@@ -1,38 +1,30 @@
 import base64
 import io
 import os
-import random
-import shutil
-import string
 import csv
+import hashlib
+import json
+import pickle
+import tempfile
 import time
+from contextlib import nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.backends.backend_svg  # Importiert das Backend explizit (für PyInstaller wichtig!)
 import configparser
-import locale
-import urllib.parse
+import math
 from datetime import datetime
-from reportlab.graphics import renderPDF
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import cm
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, KeepTogether, PageBreak, TableStyle
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
-from svglib.svglib import svg2rlg
-from lscontrolling_logo import lscontrolling_logo
 from version import program_version
 
+# matplotlib, reportlab und svglib werden erst in den Funktionen importiert, die sie benötigen. Läufe, die z.B. nur die
+# CSV-Datei erzeugen, starten dadurch deutlich schneller.
+
 # zum Debug mit print alles ausdrucken
 pd.set_option('display.max_rows', None)
 pd.set_option('display.max_columns', None)
 pd.set_option('display.width', None)
 pd.set_option('display.max_colwidth', None)
 
-# Locale auf Deutsch setzen (für Formatierung von Zahlen)
-locale.setlocale(locale.LC_ALL, 'de_DE.UTF-8')
-
 
 # --- Definition von Funktionen ----------------------------------------------------------------------------------------
 
@@ -61,7 +53,34 @@ class LSControllingConfig:
             'rm_beendet': True,
             'rm_current_year': True,
             'prt_raw': False,
-            'obfuscated': False
+            'obfuscated': False,
+            'kontostand_methode': 'vektorisiert',
+            'import_cache': True,
+            'import_blockzeilen': 0,
+            'cache_verzeichnis': 'cache',
+            'cache_max_mb': 500,
+            'batch_modus': False,
+            'batch_verzeichnis': 'output',
+            'batch_prozesse': 0,
+            'parallel_prozesse': 0,
+            'diagramm_backend': 'matplotlib',
+            'ausgabe': 'txt, pdf, csv',
+            'inkrementell': False,
+            'diagramm_cache': True,
+            'messbericht': '',
+            'messung_speicher': False,
+            'profil_schritt': '',
+            'historie': '',
+            'fakultaetsbericht': True,
+            'ueberwachung_intervall': 2,
+            'ueberwachung_ruhezeit': 5,
+            'ueberwachung_max_tage': 7,
+            'dienst_host': '127.0.0.1',
+            'dienst_port': 8080,
+            'dienst_prozesse': 0,
+            'dienst_verzeichnis': 'dienst',
+            'dienst_aufbewahrung': 24,
+            'dienst_max_mb': 200
         }
 
         if config_file and os.path.exists(config_file):
@@ -90,40 +109,251 @@ class LSControllingConfig:
         else:
             return self.defaults.get(key)
 
+    # Wert setzen (z.B. aus der Kommandozeile), hat Vorrang vor Config-Datei und Defaultwerten
+    def setzen(self, key, value):
+        if not self.config.has_section('lscontrolling'):
+            self.config.add_section('lscontrolling')
+        self.config.set('lscontrolling', key, str(value))
+
+
+# Fehlerklassen, damit Aufrufer (z.B. bei der Nutzung als Bibliothek oder im Dienst) Fehler unterscheiden können,
+# statt dass das Programm beendet wird
+class LSControllingFehler(Exception):
+    pass
+
+
+# SAP Export fehlt, ist leer oder hat nicht den erwarteten Inhalt (datei: Pfad bzw. Bezeichnung des Puffers)
+class SAPExportFehler(LSControllingFehler):
+    def __init__(self, meldung, datei=None):
+        super().__init__(meldung)
+        self.datei = datei
 
-# Klasse für zufällige, temporäre Verzeichnisse
-class RandomTemp:
-    def __init__(self, base_dir='.'):
-        self.temp_dir = None
-        random_suffix = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
-        tmp_dir_name = f'tmp_{random_suffix}'
-        tmp_dir_path = os.path.join(base_dir, tmp_dir_name)
-        os.makedirs(tmp_dir_path)
-        self.temp_dir = tmp_dir_path
 
-    def delete_temp_dir(self):
-        if self.temp_dir:
-            shutil.rmtree(self.temp_dir)
+# Inhalt der SAP Exporte passt nicht zusammen oder reicht nicht aus (z.B. unterschiedliche IKZ, zu wenig Jahre)
+class DatensatzFehler(LSControllingFehler):
+    pass
 
 
-# Zeitmessung und Infotext
+# Ungültige Einstellung (z.B. Ausgabeformat, Diagramm-Backend)
+class KonfigurationsFehler(LSControllingFehler, ValueError):
+    pass
+
+
+# Gewünschte Ausgabeformate aus einer kommagetrennten Angabe (z.B. "txt, pdf, csv") ermitteln
+def ausgabeformate(wert):
+    formate = {f.strip().lower() for f in str(wert).split(',') if f.strip()}
+    unbekannt = formate - {'txt', 'pdf', 'csv'}
+    if unbekannt:
+        raise KonfigurationsFehler(f"Unbekannte Ausgabeformate: {', '.join(sorted(unbekannt))}. "
+                                   f"Erlaubt sind: txt, pdf, csv")
+    return formate
+
+
+# Zeitmessung und Infotext (über LogContext.aktiv abschaltbar, z.B. in Batch-Prozessen). Schritte können verschachtelt
+# werden (z.B. die Sub-Berichte), innere Schritte werden dann eingerückt ausgegeben. Ist LogContext.protokoll eine
+# Liste, wird je Schritt ein Messeintrag abgelegt (Laufzeit, CPU-Zeit, Zeilen ein/aus, mit LogContext.speicher auch der
+# maximale Speicher über tracemalloc), der mit messbericht_schreiben als JSON oder CSV gespeichert werden kann. Über
+# LogContext.profil_schritt wird der erste Schritt, dessen Name damit beginnt, mit cProfile nach profil_pfad profiliert.
 class LogContext:
-    def __init__(self, message):
+    aktiv = True
+    protokoll = None
+    speicher = False
+    profil_schritt = None
+    profil_pfad = 'profil.prof'
+    offen = []  # aktuell geöffnete Schritte (äußerster zuerst)
+    zeile_offen = False  # Infotext eines Schrittes ohne Zeilenumbruch auf der Konsole
+    start_protokoll = time.perf_counter()
+
+    def __init__(self, message, zeilen_ein=None):
         self.message = message
+        self.zeilen_ein = None
+        self.zeilen_aus = None
+        self.zeilen(ein=zeilen_ein)
         self.start_time = None
+        self.start_cpu = None
+        self.ebene = 0
+        self.spitze = 0
+        self.profil = None
+
+    # Zeilenanzahl der Ein- und Ausgangsdaten für das Protokoll festlegen (z.B. len(df))
+    def zeilen(self, ein=None, aus=None):
+        if ein is not None:
+            self.zeilen_ein = int(ein)
+        if aus is not None:
+            self.zeilen_aus = int(aus)
 
     def __enter__(self):
-        self.start_time = time.time()
-        print(f"{self.message}...", end='', flush=True)
+        self.ebene = len(LogContext.offen)
+        if LogContext.speicher and LogContext.protokoll is not None:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            # Spitze des umgebenden Schrittes sichern, bevor sie für diesen Schritt zurückgesetzt wird
+            if LogContext.offen:
+                LogContext.offen[-1].spitze = max(LogContext.offen[-1].spitze, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        LogContext.offen.append(self)
+
+        if LogContext.aktiv:
+            if LogContext.zeile_offen:
+                print()
+            print(f"{'  ' * self.ebene}{self.message}...", end='', flush=True)
+            LogContext.zeile_offen = True
+
+        if LogContext.profil_schritt and self.message.startswith(LogContext.profil_schritt):
+            import cProfile
+            LogContext.profil_schritt = None  # nur einmal profilieren
+            self.profil = cProfile.Profile()
+            self.profil.enable()
+
+        self.start_cpu = time.process_time()
+        self.start_time = time.perf_counter()
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        end_time = time.time()
-        elapsed_time = end_time - self.start_time
-        print(f" OK ({elapsed_time:.2f} s)")
+        elapsed_time = time.perf_counter() - self.start_time
+        cpu_time = time.process_time() - self.start_cpu
+
+        if self.profil:
+            self.profil.disable()
+            self.profil.dump_stats(LogContext.profil_pfad)
+
+        LogContext.offen.remove(self)
+        if LogContext.protokoll is not None:
+            spitze = None
+            if LogContext.speicher:
+                import tracemalloc
+                self.spitze = max(self.spitze, tracemalloc.get_traced_memory()[1])
+                spitze = round(self.spitze / 1024 / 1024, 2)
+                if LogContext.offen:
+                    LogContext.offen[-1].spitze = max(LogContext.offen[-1].spitze, self.spitze)
+            LogContext.protokoll.append({
+                'schritt': self.message,
+                'ebene': self.ebene,
+                'uebergeordnet': LogContext.offen[-1].message if LogContext.offen else None,
+                'start_s': round(self.start_time - LogContext.start_protokoll, 4),
+                'laufzeit_s': round(elapsed_time, 4),
+                'cpu_s': round(cpu_time, 4),
+                'speicher_mb': spitze,
+                'zeilen_ein': self.zeilen_ein,
+                'zeilen_aus': self.zeilen_aus,
+                'fehler': exc_type is not None
+            })
+
+        if LogContext.aktiv:
+            # nach inneren Schritten den Namen erneut ausgeben
+            if not LogContext.zeile_offen:
+                print(f"{'  ' * self.ebene}{self.message}...", end='')
+            print(f" OK ({elapsed_time:.2f} s)" if exc_type is None else " FEHLER")
+            LogContext.zeile_offen = False
+
+    # Statusmeldung innerhalb eines Schrittes ausgeben (wie die Schritte eingerückt und über LogContext.aktiv
+    # abschaltbar); der Name des offenen Schrittes wird danach mit dem Ergebnis erneut ausgegeben
+    @staticmethod
+    def meldung(text):
+        if not LogContext.aktiv:
+            return
+        if LogContext.zeile_offen:
+            print()
+            LogContext.zeile_offen = False
+        print(f"{'  ' * len(LogContext.offen)}{text}")
+
+    # Protokoll für einen neuen Lauf vorbereiten (aus den Config-Schlüsseln messbericht, messung_speicher und
+    # profil_schritt; profil_pfad: Zieldatei für die cProfile Ausgabe)
+    @staticmethod
+    def konfigurieren(config, profil_pfad='profil.prof'):
+        LogContext.protokoll = [] if config['messbericht'] else None
+        LogContext.speicher = bool(config['messung_speicher'])
+        LogContext.profil_schritt = config['profil_schritt'] or None
+        LogContext.profil_pfad = profil_pfad
+        LogContext.start_protokoll = time.perf_counter()
+
+    # Protokoll als JSON- oder CSV-Datei schreiben (Format nach der Dateiendung)
+    @staticmethod
+    def messbericht_schreiben(filename):
+        eintraege = LogContext.protokoll or []
+        if filename.lower().endswith('.csv'):
+            spalten = ['schritt', 'ebene', 'uebergeordnet', 'start_s', 'laufzeit_s', 'cpu_s', 'speicher_mb',
+                       'zeilen_ein', 'zeilen_aus', 'fehler']
+            with open(filename, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=spalten, delimiter=';')
+                writer.writeheader()
+                writer.writerows(eintraege)
+        else:
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump({'version': program_version, 'erstellt': datetime.now().isoformat(timespec='seconds'),
+                           'schritte': eintraege}, f, ensure_ascii=False, indent=2)
+
+
+# Persistenter Dateicache; Einträge bestehen aus einer oder mehreren Dateien mit gleichem Schlüssel. Bei Überschreiten
+# der Maximalgröße werden die am längsten nicht genutzten Einträge gelöscht.
+class DateiCache:
+    def __init__(self, verzeichnis, max_mb):
+        self.verzeichnis = verzeichnis
+        self.max_bytes = max_mb * 1024 * 1024
+        os.makedirs(verzeichnis, exist_ok=True)
+
+    def pfad(self, schluessel, endung):
+        return os.path.join(self.verzeichnis, schluessel + endung)
+
+    # Prüfen, ob alle Dateien eines Eintrags vorhanden sind; bei einem Treffer den Zugriffszeitpunkt aktualisieren
+    def vorhanden(self, schluessel, endungen):
+        pfade = [self.pfad(schluessel, e) for e in endungen]
+        if not all(os.path.exists(p) for p in pfade):
+            return False
+        for p in pfade:
+            os.utime(p)
+        return True
+
+    # Datei atomar schreiben (erst temporär, dann umbenennen), damit abgebrochene Läufe keine halben Einträge erzeugen
+    def schreiben(self, schluessel, endung, schreibfunktion):
+        ziel = self.pfad(schluessel, endung)
+        tmp = f"{ziel}.{os.getpid()}.tmp"
+        try:
+            schreibfunktion(tmp)
+            os.replace(tmp, ziel)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    # Eintrag löschen (Dateien, die ein paralleler Prozess bereits entfernt hat, werden übergangen)
+    def loeschen(self, schluessel):
+        for datei in os.listdir(self.verzeichnis):
+            if datei.split('.')[0] == schluessel:
+                try:
+                    os.remove(os.path.join(self.verzeichnis, datei))
+                except FileNotFoundError:
+                    pass
+
+    # Älteste Einträge entfernen, bis die Maximalgröße eingehalten wird
+    def aufraeumen(self):
+        eintraege = dict()
+        for datei in os.listdir(self.verzeichnis):
+            if datei.endswith('.tmp'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.verzeichnis, datei))
+            except FileNotFoundError:
+                continue
+            groesse, zeit = eintraege.get(datei.split('.')[0], (0, 0))
+            eintraege[datei.split('.')[0]] = (groesse + stat.st_size, max(zeit, stat.st_mtime))
+
+        gesamt = sum(groesse for groesse, _ in eintraege.values())
+        for schluessel, (groesse, _) in sorted(eintraege.items(), key=lambda x: x[1][1]):
+            if gesamt <= self.max_bytes:
+                break
+            self.loeschen(schluessel)
+            gesamt -= groesse
 
 
 # SAP CSV Dateien grob prüfen, ob die richtigen Header vorhanden sind
 def check_sap_csv_content(file_path, csv_type):
+    with open(file_path, 'r', newline='', encoding='utf-8') as csvfile:
+        return check_sap_header([next(csvfile), next(csvfile)], file_path, csv_type)
+
+
+# Die ersten beiden Zeilen einer SAP CSV Datei prüfen und das Erstelldatum zurückliefern
+def check_sap_header(lines, file_path, csv_type):
     # Mapping der erwarteten Werte
     expected_values = {
         'stammdaten': "Stammdaten HHP",
@@ -133,41 +363,227 @@ def check_sap_csv_content(file_path, csv_type):
     }
 
     if csv_type not in expected_values:
-        raise Exception(f"Programmierfehler: {csv_type} nicht bekannt in Funktion check_sap_csv_content!")
+        raise Exception(f"Programmierfehler: {csv_type} nicht bekannt in Funktion check_sap_header!")
 
-    with open(file_path, 'r', newline='', encoding='utf-8') as csvfile:
-        reader = csv.reader(csvfile, delimiter=';')  # Semikolon als Trennzeichen
+    reader = csv.reader(lines, delimiter=';')  # Semikolon als Trennzeichen
+    expected_value = expected_values[csv_type]
+    try:
         first_line = next(reader)  # Liest die erste Zeile
         tp = first_line[1]
-        expected_value = expected_values[csv_type]
         second_line = next(reader)
-        if tp == expected_value:
-            return "Datensatz " + expected_value + " vom " + second_line[1]
-        else:
-            raise Exception(f"{file_path} enthält nicht den erwarteten Inhalt '{expected_value}' sondern '{tp}'")
+        erstellt = second_line[1]
+    except (StopIteration, IndexError):
+        raise SAPExportFehler(f"{file_path} enthält nicht die erwarteten Kopfzeilen für '{expected_value}'", file_path)
+    if tp == expected_value:
+        return "Datensatz " + expected_value + " vom " + erstellt
+    else:
+        raise SAPExportFehler(f"{file_path} enthält nicht den erwarteten Inhalt '{expected_value}' sondern '{tp}'",
+                              file_path)
+
 
+# Fehler beim Laden einer CSV-Datei in einen SAPExportFehler mit Hinweis für die Anwender umwandeln (zum Auslösen
+# durch den Aufrufer)
+def csv_ladefehler(file_path, fehler):
+    if isinstance(fehler, pd.errors.EmptyDataError):
+        return SAPExportFehler(f"Die Datei {file_path} enthält keine Datenzeilen. Bitte prüfen. Im Falle von nicht "
+                               f"vorhandenen Obligos bitte mit einem existierenden PSP-Element und Festlegungen von 0 "
+                               f"Euro auffüllen.", file_path)
+    return SAPExportFehler(f"Für das Programm müssen bestimmte CSV Dateien vorhanden sein.\nBitte prüfen Sie, dass die "
+                           f"Datei {file_path} im korrekten Unterordner vorliegt und nutzbar ist!", file_path)
 
-# Funktion zum Laden der CSV-Datei mit dynamischem Header
+
+# Inhalt eines SAP Exports als Bytes; die Quelle ist ein Dateipfad, Bytes oder ein Dateiobjekt (binär oder Text)
+def export_lesen(quelle):
+    if isinstance(quelle, (bytes, bytearray, memoryview)):
+        return bytes(quelle)
+    if hasattr(quelle, 'read'):
+        inhalt = quelle.read()
+        return inhalt.encode('utf-8') if isinstance(inhalt, str) else inhalt
+    with open(quelle, 'rb') as f:
+        return f.read()
+
+
+# Bezeichnung einer Quelle für Meldungen: Dateipfad, Name des Dateiobjekts oder Datentyp
+def exportname(quelle, csv_type):
+    if isinstance(quelle, (str, os.PathLike)):
+        return os.fspath(quelle)
+    return getattr(quelle, 'name', None) or f"{csv_type} (Puffer)"
+
+
+# CSV-Datei oder Puffer im SAP Format (Semikolon, deutsche Dezimalzahlen) ohne Fehlerbehandlung einlesen (optionen:
+# weitere Parameter für pd.read_csv, z.B. chunksize)
+def read_sap_csv(quelle, header_row, dtype_map=None, **optionen):
+    return pd.read_csv(quelle, sep=';', skiprows=header_row, header=None, dtype=dtype_map, decimal=',', thousands='.',
+                       **optionen)
+
+
+# Funktion zum Laden der CSV-Datei mit dynamischem Header (Dateipfad, Bytes oder Dateiobjekt)
 def load_csv_with_dynamic_header(file_path, header_row, dtype_map=None):
     try:
-        return pd.read_csv(file_path, sep=';', skiprows=header_row, header=None, dtype=dtype_map,
-                           decimal=',', thousands='.')
-    except pd.errors.EmptyDataError:
-        print(f"Die Datei {file_path} enthält keine Datenzeilen. Bitte prüfen. Im Falle von nicht vorhandenen Obligos "
-              f"bitte mit einem existierenden PSP-Element und Festlegungen von 0 Euro auffüllen.")
-        exit(1)
-    except FileNotFoundError:
-        print(f"Für das Programm müssen bestimmte CSV Dateien vorhanden sein.\nBitte prüfen Sie, dass die Datei "
-              f"{file_path} im korrekten Unterordner vorliegt und nutzbar ist!")
-        exit(1)
-
-
-# Funktion zum Schreiben von CSV Daten
+        return read_sap_csv(io.BytesIO(export_lesen(file_path)), header_row, dtype_map)
+    except (pd.errors.EmptyDataError, FileNotFoundError) as e:
+        raise csv_ladefehler(exportname(file_path, 'csv'), e) from e
+
+
+# SAP Export (Dateipfad, Bytes oder Dateiobjekt) genau einmal lesen: Header prüfen, Erstelldatum ermitteln und Daten
+# aus demselben Puffer laden. Läuft im Threadpool, deshalb werden Ladefehler nicht hier, sondern vom Aufrufer gemeldet.
+def load_sap_export(file_path, csv_type, header_row, dtype_map=None, check=True):
+    raw = export_lesen(file_path)
+
+    rep_info = None
+    if check:
+        lines = raw.split(b'\n', 2)[:2]
+        rep_info = check_sap_header([line.decode('utf-8', errors='replace') for line in lines],
+                                    exportname(file_path, csv_type), csv_type)
+
+    return read_sap_csv(io.BytesIO(raw), header_row, dtype_map), rep_info
+
+
+# Relevante Spalten aus Budget und Obligo (Spalte im SAP Export -> Name nach dem Import)
+bewegungsspalten = {
+    'budget': {0: 'PSP', 1: 'PSPName', 2: 'Jahr', 7: 'Budgetrest aus Vorjahr', 8: 'Originalbudget',
+               9: 'Sonstige Zuweisungen'},
+    'obligo': {3: 'PSP', 4: 'PSPName', 0: 'Jahr', 7: 'Festlegungen'}
+}
+
+
+# Budget bzw. Obligo bereinigen: Ergebniszeilen entfernen (nur Budget), relevante Spalten auswählen und benennen und
+# NaN mit 0 ersetzen. Spalten, die nur fehlende Werte enthalten (z.B. in einem Block des blockweisen Imports, der nur
+# die Gesamtergebniszeile enthält), werden vorher über infer_objects typisiert, damit fillna keine Objektspalten
+# umwandeln muss (von pandas als veraltet gemeldet).
+def bewegungen_bereinigen(df, csv_type):
+    if csv_type == 'budget':
+        df = not_cont(df, 6, 'Ergebnis')
+    spalten = bewegungsspalten[csv_type]
+    df = df[list(spalten)].infer_objects(copy=False).fillna(0)
+    df.columns = list(spalten.values())
+    return df
+
+
+# Budget bzw. Obligo blockweise (je block_zeilen Zeilen) einlesen und jeden Block bereinigt in laufende Summen je
+# PSP-Element und Jahr einrechnen. Der Speicherbedarf hängt so von der Anzahl der PSP-Jahre ab und nicht von der
+# Zeilenzahl des Exports. Rückgabe wie load_sap_export, die Daten aber bereits bereinigt und gruppiert.
+def load_sap_export_summiert(file_path, csv_type, header_row, dtype_map=None, check=True, block_zeilen=100000):
+    # Dateien werden direkt gelesen, Bytes und Dateiobjekte liegen ohnehin im Speicher
+    if isinstance(file_path, (str, os.PathLike)):
+        quelle = open(file_path, 'rb')
+    else:
+        quelle = io.BytesIO(export_lesen(file_path))
+
+    with quelle:
+        rep_info = None
+        if check:
+            lines = [quelle.readline(), quelle.readline()]
+            rep_info = check_sap_header([line.decode('utf-8', errors='replace') for line in lines],
+                                        exportname(file_path, csv_type), csv_type)
+            quelle.seek(0)
+
+        # nur die benötigten Spalten lesen (Spalte 6 enthält im Budget die Ergebniszeilen)
+        spalten = set(bewegungsspalten[csv_type]) | ({6} if csv_type == 'budget' else set())
+        dtype_map = {s: t for s, t in {6: 'str', **(dtype_map or dict())}.items() if s in spalten}
+        summen = None
+        for block in read_sap_csv(quelle, header_row, dtype_map, usecols=sorted(spalten),
+                                  chunksize=block_zeilen):
+            block = bewegungen_bereinigen(block, csv_type).groupby(['PSP', 'PSPName', 'Jahr']).sum(numeric_only=True)
+            summen = block if summen is None else pd.concat([summen, block]).groupby(level=[0, 1, 2]).sum()
+
+    return summen.reset_index(), rep_info
+
+
+# Funktion zum Schreiben von CSV Daten (Beträge in Cent werden dabei in Euro umgerechnet). Ist die Datei nicht
+# beschreibbar (z.B. noch in Excel geöffnet), wird ein PermissionError mit Hinweis ausgelöst.
 def write_csv(df, file_path):
     try:
-        df.to_csv(file_path, sep=";", decimal=',', encoding='cp1252', index=False)
-    except PermissionError:
-        print(f"Die Datei {file_path} kann nicht geschrieben werden. Bitte prüfen Sie ob sie nicht noch geöffnet ist!")
+        betraege_in_euro(df).to_csv(file_path, sep=";", decimal=',', encoding='cp1252', index=False)
+    except PermissionError as e:
+        raise PermissionError(f"Die Datei {file_path} kann nicht geschrieben werden. Bitte prüfen Sie ob sie nicht "
+                              f"noch geöffnet ist!") from e
+
+
+# Geldbeträge spaltenweise im deutschen Format darstellen (z.B. -1.234,50 €), unabhängig von der eingestellten locale.
+# Nimmt eine Series, ein Array oder eine Liste und liefert Texte in gleicher Form zurück (eine Series mit gleichem
+# Index); fehlende Werte werden als na ausgegeben. Die Eingabe wird nicht verändert.
+def euro_format(werte, einheit=' €', na='k.A.', nachkommastellen=2):
+    zahlen = np.asarray(werte, dtype='float64').reshape(-1)
+    fehlend = np.isnan(zahlen)
+    faktor = 10 ** nachkommastellen
+
+    # Betrag auf ganze Cent (bzw. gewünschte Nachkommastellen) runden und in Vor- und Nachkommaanteil zerlegen. Werte
+    # nahe an x,xx5 werden wie bei '%.2f' exakt über die Binärdarstellung gerundet (np.rint rundet dort auf gerade).
+    # Unendliche und sehr große Beträge (ab 2**53, wo nicht mehr jede ganze Zahl als float darstellbar ist und int64
+    # überlaufen kann) werden am Ende einzeln und exakt über die Python-Formatierung dargestellt.
+    skaliert = np.abs(np.where(fehlend, 0, zahlen)) * faktor
+    einzeln = ~fehlend & ~(skaliert < 2 ** 53)
+    skaliert[einzeln] = 0
+    betrag = np.rint(skaliert).astype(np.int64)
+    grenzfall = np.abs(skaliert - np.floor(skaliert) - 0.5) < 1e-6
+    for i in np.flatnonzero(grenzfall):
+        betrag[i] = int(f"{abs(zahlen[i]):.{nachkommastellen}f}".replace('.', ''))
+    ganz, rest = np.divmod(betrag, faktor)
+
+    # Text als Zeichenmatrix aufbauen: eine Spalte für das Vorzeichen, die Ziffern des Vorkommaanteils in Dreiergruppen
+    # mit Tausenderpunkt, Komma und Nachkommastellen. Stellen vor der ersten Ziffer bleiben leer.
+    gruppen = max(1, math.ceil(len(str(int(ganz.max(initial=0)))) / 3))
+    stellen = 3 * gruppen
+    laenge = stellen + gruppen + (nachkommastellen + 1 if nachkommastellen else 0)
+    zeichen = np.full((len(zahlen), laenge), ord('.'), dtype=np.uint32)
+    k = np.arange(stellen)
+    zeichen[:, 1 + k + k // 3] = ganz[:, None] // 10 ** (stellen - 1 - k) % 10 + ord('0')
+    if nachkommastellen:
+        k = np.arange(nachkommastellen)
+        zeichen[:, laenge - nachkommastellen - 1] = ord(',')
+        zeichen[:, laenge - nachkommastellen:] = rest[:, None] // 10 ** (nachkommastellen - 1 - k) % 10 + ord('0')
+    erste = stellen - 1 - np.searchsorted(10 ** np.arange(1, stellen), ganz, side='right')  # erste Ziffer != 0
+    erste = 1 + erste + erste // 3
+    zeichen[np.arange(laenge) < erste[:, None]] = ord(' ')
+    negativ = np.signbit(zahlen) & ~fehlend
+    zeichen[negativ, erste[negativ] - 1] = ord('-')
+
+    text = np.char.lstrip(zeichen.view(f'U{laenge}')[:, 0])
+    text = np.where(fehlend, na, np.char.add(text, einheit)).astype(object)
+    for i in np.flatnonzero(einzeln):
+        text[i] = f"{zahlen[i]:,.{nachkommastellen}f}".translate(str.maketrans(',.', '.,')) + einheit
+
+    if isinstance(werte, pd.Series):
+        return pd.Series(text, index=werte.index, name=werte.name, dtype=object)
+    return text
+
+
+# Einzelnen Geldbetrag im deutschen Format darstellen (siehe euro_format)
+def euro(wert, einheit=' €', nachkommastellen=2):
+    return euro_format([wert], einheit, nachkommastellen=nachkommastellen)[0]
+
+
+# Nach dem Import werden die Kennungen als Kategorien und alle Geldbeträge als ganze Cent (Int64, fehlende Werte als
+# <NA>) gehalten. Das spart Speicher bei großen Datensätzen, und Summen über viele PSP-Elemente sind exakt. In Euro
+# umgerechnet wird erst bei der Ausgabe (Tabellen, Diagramme, CSV).
+kennungsspalten = ['PSP', 'PSPName', 'PA', 'Status', 'Geldgeber']
+betragsspalten = ['Budgetrest aus Vorjahr', 'Originalbudget', 'Sonstige Zuweisungen', 'Festlegungen',
+                  'End Kontostand Budget', 'Einnahmen-Ist', 'Einnahmen ILA', 'Eigen- und Industrieanteile',
+                  'Ausgaben-Ist', 'Kontostand Jahr', 'End Kontostand DM', 'Kontostand']
+
+
+# Datensatz in die kompakte Darstellung umwandeln (bereits umgewandelte Spalten bleiben unverändert)
+def kompakt(df):
+    df = df.copy()
+    for col in [c for c in kennungsspalten if c in df.columns]:
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    for col in [c for c in betragsspalten if c in df.columns]:
+        if pd.api.types.is_float_dtype(df[col]):
+            df[col] = (df[col] * 100).round().astype('Int64')
+    return df
+
+
+# Beträge in Cent (ganzzahlig) in Euro umrechnen; nimmt eine Series oder ein DataFrame (dort alle ganzzahligen
+# Betragsspalten), andere Werte bleiben unverändert
+def betraege_in_euro(werte):
+    if isinstance(werte, pd.DataFrame):
+        spalten = [c for c in betragsspalten if c in werte.columns and pd.api.types.is_integer_dtype(werte[c])]
+        return werte.assign(**{c: betraege_in_euro(werte[c]) for c in spalten}) if spalten else werte
+    if pd.api.types.is_integer_dtype(werte):
+        return werte.astype('float64') / 100
+    return werte
 
 
 # Funktion zur Selektion gewisser Spalten die einen Eintrag enthalten
@@ -212,14 +628,17 @@ def keine_sammelkonten(df):
     return not_cont(df, "Geldgeber", "^999$|^1$", True)
 
 
-# involvierte IKZ aus dem Datensatz extrahieren, wenn mehr als eine dann, Exception werfen
-def get_ikz(df):
+# involvierte IKZ aus dem Datensatz extrahieren, wenn mehr als eine dann, Exception werfen (im Batch-Modus wird
+# stattdessen die sortierte Liste aller IKZ zurückgeliefert)
+def get_ikz(df, batch=False):
     df_ikz = df['PSP'].str[5:11]
     grouped = df_ikz.value_counts()
 
     # Überprüfe die Anzahl der Gruppen
-    if len(grouped) > 1:
-        raise Exception(f"Mehr als eine IKZ im Datensatz gefunden! Bitte prüfen!\n{grouped}")
+    if batch:
+        return sorted(grouped.index)
+    elif len(grouped) > 1:
+        raise DatensatzFehler(f"Mehr als eine IKZ im Datensatz gefunden! Bitte prüfen!\n{grouped}")
     else:
         return grouped.index[0]
 
@@ -229,68 +648,179 @@ def check_jahr(df):
     # Überprüfe die Anzahl der Gruppen
     grouped = df['Jahr'].value_counts()
     if len(grouped) <= 1:
-        raise Exception(f"Zu wenig Jahre im Datensatz gefunden. Bitte prüfen! {list(df.columns)}")
+        raise DatensatzFehler(f"Zu wenig Jahre im Datensatz gefunden. Bitte prüfen! {list(df.columns)}")
 
 
-# Datenimport aus SAP CSV Tabellen
-def import_sap_csv(config: LSControllingConfig):
-    # Festlegung der Datentypen (abweichend von standard)
-    cv_stammdaten = 'str'
-    cv_budget = {0: 'str', 2: 'str', 7: 'float', 8: 'float', 9: 'float'}
-    cv_obligo = {0: 'str', 3: 'str', 4: 'str', 7: 'float'}
-    cv_kst = {0: 'str', 1: 'str', 2: 'str', 3: 'float', 4: 'float', 5: 'float', 6: 'float', 7: 'float'}
+# Kontostände je PSP-Element über drei groupby().apply Durchläufe berechnen (ursprüngliches Verfahren)
+def kontostand_apply(df):
+    # Berechne die kumulative Summe nur für PSP-Elemente mit Einträgen in "Kontostand Jahr"
+    def calculate_cumsum(group):
+        if group['Kontostand Jahr'].notna().any():
+            group['End Kontostand DM'] = group['Kontostand Jahr'].fillna(0).cumsum()
+        else:
+            group['End Kontostand DM'] = np.nan
+        return group
 
-    daten = ['stammdaten', 'budget', 'obligo', 'kst']
+    df = df.groupby('PSP').apply(calculate_cumsum).reset_index(drop=True)
 
-    # Prüfen, ob die Header in den CSV-Dateien geprüft werden sollen. Wenn ja, ebenfalls Erstelldatum zurückliefern
-    rep_data = ""
-    for d in daten:
-        if config[f'check_{d}']:
-            rep_data += str(check_sap_csv_content(config[f'csv_{d}'], d)) + "\n"
+    # Budgetrest aus Vorjahr ein Jahr nach vorne schieben, Obligo abziehen und im Jahr davor als End-Kontostand angeben
+    def shift_kontostand(group):
+        group['End Kontostand Budget'] = group['Budgetrest aus Vorjahr'].shift(-1) - group['Festlegungen']
+        group.at[group.index[-1], 'End Kontostand Budget'] = 0
+        return group
 
-    # CSV-Dateien laden
-    df_stammdaten = load_csv_with_dynamic_header(config['csv_stammdaten'], config['header_stammdaten'], cv_stammdaten)
-    df_budget = load_csv_with_dynamic_header(config['csv_budget'], config['header_budget'], cv_budget)
-    df_obligo = load_csv_with_dynamic_header(config['csv_obligo'], config['header_obligo'], cv_obligo)
-    df_kst = load_csv_with_dynamic_header(config['csv_kst'], config['header_kst'], cv_kst)
+    df = df.groupby('PSP').apply(shift_kontostand).reset_index(drop=True)
 
-    # Daten vorab bereinigen (alle Zeilen löschen, die ein Ergebnis oder Gesamtergebnis sind)
-    df_budget = not_cont(df_budget, 6, 'Ergebnis')
-    df_kst = not_cont(df_kst, 2, 'Ergebnis')
-    df_kst = df_kst[df_kst[0] != 'Gesamtergebnis']
+    # Erzeuge die neue Spalte 'Kontostand' nach dem Prinzip: wenn es ein Kontostand aus Drittmitteln gibt, nimm den,
+    # ansonsten den Kontostand, der aus dem Budget erzeugt wurde
+    def choose_kontostand(group):
+        if group['End Kontostand DM'].notna().any():
+            group['Kontostand'] = group['End Kontostand DM']
+        else:
+            group['Kontostand'] = group['End Kontostand Budget']
+        return group
 
-    # Auswahl und Sortierung von relevanten Spalten der einzelnen Tabellen und NaN mit 0 ersetzen
-    df_stammdaten_relevant = df_stammdaten[[3, 4, 2, 7, 10]]
-    df_budget_relevant = df_budget[[0, 1, 2, 7, 8, 9]].fillna(0)
-    df_obligo_relevant = df_obligo[[3, 4, 0, 7]].fillna(0)
-    df_kst_relevant = df_kst[[0, 1, 2, 3, 4, 5, 6, 7]].fillna(0)
+    return df.groupby('PSP').apply(choose_kontostand).reset_index(drop=True)
 
-    # neue Spaltenüberschriften nach dem Filtern setzen
-    df_stammdaten_relevant.columns = ['PSP', 'PSPName', 'Status', 'Projektende', 'Geldgeber']
-    df_budget_relevant.columns = ['PSP', 'PSPName', 'Jahr', 'Budgetrest aus Vorjahr', 'Originalbudget',
-                                  'Sonstige Zuweisungen']
-    df_obligo_relevant.columns = ['PSP', 'PSPName', 'Jahr', 'Festlegungen']
-    df_kst_relevant.columns = ['PSP', 'PSPName', 'Jahr', 'Einnahmen ILA', 'Einnahmen-Ist',
-                               'Eigen- und Industrieanteile', 'Ausgaben-Ist', 'Kontostand Jahr']
 
-    # IKZ der Datensätze prüfen (es müssen alle aus allen Datensätzen gleich sein)
-    ikz_stammdaten = get_ikz(df_stammdaten_relevant)
-    ikz_budget = get_ikz(df_budget_relevant)
-    ikz_obligo = get_ikz(df_obligo_relevant)
-    ikz_kst = get_ikz(df_kst_relevant)
+# Kontostände je PSP-Element vektorisiert berechnen (gleiches Ergebnis wie kontostand_apply, aber ohne Python-Aufruf
+# pro PSP-Element)
+def kontostand_vektorisiert(df):
+    # stabil nach PSP sortieren, damit Reihenfolge und Index dem groupby().apply Ergebnis entsprechen
+    df = df.sort_values('PSP', kind='stable').reset_index(drop=True)
+    psp = df.groupby('PSP', sort=False)
 
-    if not (ikz_stammdaten == ikz_budget == ikz_obligo == ikz_kst):
-        raise Exception("Die IKZ-Werte der vier Input Dateien stimmen nicht überein!")
-    ikz = ikz_stammdaten
+    # Maske für PSP-Elemente mit mindestens einem Eintrag in "Kontostand Jahr"
+    hat_dm = psp['Kontostand Jahr'].transform('count') > 0
 
-    # Bereinigen und Gruppieren nach Ergebnissen pro Jahr
-    df_budget_relevant = df_budget_relevant.groupby(['PSP', 'PSPName', 'Jahr']).sum(numeric_only=True).reset_index()
-    df_obligo_relevant = df_obligo_relevant.groupby(['PSP', 'PSPName', 'Jahr']).sum(numeric_only=True).reset_index()
-    df_kst_relevant = df_kst_relevant.groupby(['PSP', 'PSPName', 'Jahr']).sum(numeric_only=True).reset_index()
+    # kumulative Summe des Drittmittelkontostands (nur für PSP-Elemente mit Drittmitteleinträgen). Die Werte werden
+    # dazu zeilenweise je PSP in eine Matrix gelegt und mit np.cumsum aufsummiert, damit die Summationsreihenfolge (und
+    # damit jede Nachkommastelle) exakt der Series.cumsum je Gruppe entspricht.
+    gruppe = psp.ngroup().to_numpy()
+    position = psp.cumcount().to_numpy()
+    matrix = np.zeros((psp.ngroups, position.max() + 1 if len(df) else 0))
+    matrix[gruppe, position] = df['Kontostand Jahr'].fillna(0).to_numpy()
+    dm = pd.Series(np.cumsum(matrix, axis=1)[gruppe, position], index=df.index)
+    df['End Kontostand DM'] = dm.where(hat_dm, np.nan)
+
+    # Budgetrest aus Vorjahr ein Jahr nach vorne schieben und Obligo abziehen; letztes Jahr je PSP auf 0 setzen
+    budget = psp['Budgetrest aus Vorjahr'].shift(-1) - df['Festlegungen']
+    letzte_zeile = ~df['PSP'].duplicated(keep='last')
+    df['End Kontostand Budget'] = budget.mask(letzte_zeile, 0)
+
+    # Drittmittelkontostand bevorzugen, ansonsten Kontostand aus dem Budget
+    df['Kontostand'] = df['End Kontostand DM'].where(hat_dm, df['End Kontostand Budget'])
+    return df
 
-    # Prüfen, ob mehr als ein Jahr enthalten ist
-    check_jahr(df_budget_relevant)
-    check_jahr(df_kst_relevant)
+
+# Auswahl des Verfahrens zur Kontostandsberechnung ('vektorisiert' oder 'apply')
+def kontostand_berechnen(df, methode='vektorisiert'):
+    verfahren = {
+        'vektorisiert': kontostand_vektorisiert,
+        'apply': kontostand_apply
+    }
+
+    if methode not in verfahren:
+        raise KonfigurationsFehler(f"Unbekannte Methode '{methode}' zur Kontostandsberechnung! Erlaubt sind: "
+                                   f"{', '.join(verfahren)}")
+    return verfahren[methode](df)
+
+
+# Spalten der zusammengeführten Tabelle vor der Kontostandsberechnung (siehe import_zusammenfuehren)
+stammdatenspalten = ['PSP', 'PSPName', 'Status', 'Projektende', 'Geldgeber']
+quellspalten = {
+    'budget': ['Budgetrest aus Vorjahr', 'Originalbudget', 'Sonstige Zuweisungen'],
+    'obligo': ['Festlegungen'],
+    'kst': ['Einnahmen ILA', 'Einnahmen-Ist', 'Eigen- und Industrieanteile', 'Ausgaben-Ist', 'Kontostand Jahr']
+}
+
+# Auswahl der Ausdrucke im Detailbericht
+prt = ['PSP', 'PSPName', 'PA', 'Status', 'Geldgeber', 'Projektende', 'Jahr', 'Budgetrest aus Vorjahr', 'Originalbudget',
+       'Sonstige Zuweisungen', 'Festlegungen', 'End Kontostand Budget', 'Einnahmen-Ist', 'Einnahmen ILA',
+       'Eigen- und Industrieanteile', 'Ausgaben-Ist', 'Kontostand Jahr', 'End Kontostand DM', 'Kontostand']
+
+
+# Stammdaten, Budget, Obligo und Drittmittelkontostand (bereits nach PSP, PSPName und Jahr gruppiert) zusammenführen
+# und die Kontostände berechnen. Die Zeilen eines PSP-Elements hängen nur von dessen Zeilen in den Quellen ab. Sind die
+# Stammdaten eindeutig je PSP und PSPName und vollständig, wird über ganzzahlige Schlüssel verbunden, ansonsten über
+# pd.merge (Mehrfachtreffer und fehlende Werte werden dort wie bisher behandelt). Rückgabe: Budget und Drittmittel-
+# kontostand jeweils mit Stammdaten (für prt_raw) und die zusammengeführte Tabelle mit Kontostand.
+def import_zusammenfuehren(quellen, methode='vektorisiert'):
+    stammdaten = quellen['stammdaten'][stammdatenspalten]
+    if stammdaten.duplicated(['PSP', 'PSPName']).any() or stammdaten.isna().any().any():
+        return import_zusammenfuehren_merge(quellen, methode)
+    return import_zusammenfuehren_ids(quellen, methode)
+
+
+# Zusammenführen über ganzzahlige Schlüssel: jede Quelle wird einmal über PSP und PSPName auf die Zeilennummer in den
+# (sortierten) Stammdaten abgebildet, Schlüssel aus Nummer und Jahr werden als Vereinigung aller Quellen gebildet und
+# die Stammdaten erst am Ende angehängt. Zeilen, Reihenfolge und Werte entsprechen dem Outer Join in
+# import_zusammenfuehren_merge (dort nach allen Schlüsselspalten sortiert).
+def import_zusammenfuehren_ids(quellen, methode='vektorisiert'):
+    stammdaten = quellen['stammdaten'][stammdatenspalten].sort_values(['PSP', 'PSPName']).reset_index(drop=True)
+
+    # je Quelle die Stammdatennummer (-1 für Zeilen ohne Stammdaten, z.B. das Gesamtergebnis; diese entfallen). Ist das
+    # PSP-Element in den Stammdaten eindeutig, genügt die Suche über PSP mit anschließendem Vergleich des PSPName.
+    if stammdaten['PSP'].is_unique and len(stammdaten):
+        psp_index = pd.Index(stammdaten['PSP'])
+        namen = stammdaten['PSPName'].to_numpy()
+
+        def stammdatennummer(df):
+            nummer = psp_index.get_indexer(df['PSP'])
+            return np.where((nummer >= 0) & (namen.take(nummer, mode='clip') == df['PSPName'].to_numpy()), nummer, -1)
+    else:
+        stamm_index = pd.MultiIndex.from_frame(stammdaten[['PSP', 'PSPName']])
+
+        def stammdatennummer(df):
+            return stamm_index.get_indexer(pd.MultiIndex.from_frame(df[['PSP', 'PSPName']]))
+
+    ids = {q: stammdatennummer(quellen[q]) for q in quellspalten}
+
+    # Jahre über alle Quellen einheitlich (wie die Texte sortiert) nummerieren und Schlüssel aus Nummer und Jahr bilden
+    jahre = pd.Index(sorted(set().union(*(quellen[q]['Jahr'][ids[q] >= 0].unique() for q in quellspalten))))
+    anzahl_jahre = max(len(jahre), 1)
+    schluessel = {q: ids[q][ids[q] >= 0] * anzahl_jahre + jahre.get_indexer(quellen[q]['Jahr'][ids[q] >= 0])
+                  for q in quellspalten}
+
+    # Vereinigung der Schlüssel (sortiert); Budget und Obligo sind wie nach fillna(0) im Merge mit 0 vorbelegt,
+    # soweit das PSP-Element in dem Jahr in einer der beiden Quellen vorkommt
+    alle = np.unique(np.concatenate(list(schluessel.values())))
+    budget_obligo = np.isin(alle, np.concatenate([schluessel['budget'], schluessel['obligo']]))
+    spalten = dict()
+    for q, namen_quelle in quellspalten.items():
+        position = np.searchsorted(alle, schluessel[q])
+        werte = quellen[q][namen_quelle].to_numpy(dtype='float64')[ids[q] >= 0]
+        for i, name in enumerate(namen_quelle):
+            spalte = np.where(budget_obligo, 0.0, np.nan) if q != 'kst' else np.full(len(alle), np.nan)
+            spalte[position] = werte[:, i]
+            spalten[name] = spalte
+
+    # Stammdaten einmal am Ende anhängen (Projektende und PA nur einmal je PSP-Element ermitteln)
+    stammdaten_ende = stammdaten.assign(Projektende=pd.to_datetime(stammdaten['Projektende'], format='%d.%m.%Y'),
+                                        PA=stammdaten['PSP'].str[3:5])
+    df = stammdaten_ende.take(alle // anzahl_jahre).reset_index(drop=True)
+    df.insert(len(stammdatenspalten), 'Jahr', jahre.take(alle % anzahl_jahre).to_numpy())
+    df = df.assign(**spalten)
+
+    # Kontostände je PSP-Element berechnen (Verfahren über Config wählbar)
+    df = kontostand_berechnen(df, methode)
+
+    # Budget und Drittmittelkontostand mit Stammdaten wie beim Inner Join (Reihenfolge der Quelle)
+    def mit_stammdaten(q):
+        treffer = ids[q] >= 0
+        teil = stammdaten.take(ids[q][treffer]).reset_index(drop=True)
+        teil['Jahr'] = quellen[q]['Jahr'].to_numpy()[treffer]
+        return pd.concat([teil, quellen[q][quellspalten[q]][treffer].reset_index(drop=True)], axis=1)
+
+    return mit_stammdaten('budget'), mit_stammdaten('kst'), df[prt]
+
+
+# Zusammenführen über pd.merge auf den Textspalten (ursprüngliches Verfahren)
+def import_zusammenfuehren_merge(quellen, methode='vektorisiert'):
+    df_stammdaten_relevant = quellen['stammdaten']
+    df_budget_relevant = quellen['budget']
+    df_obligo_relevant = quellen['obligo']
+    df_kst_relevant = quellen['kst']
 
     # Stammdaten mergen
     df_budget_merged = pd.merge(df_budget_relevant,
@@ -322,43 +852,101 @@ def import_sap_csv(config: LSControllingConfig):
     df_budget_kst_merged['PA'] = df_budget_kst_merged['PSP'].str[3:5]
     df_budget_kst_merged['Projektende'] = pd.to_datetime(df_budget_kst_merged['Projektende'], format='%d.%m.%Y')
 
-    # Berechne die kumulative Summe nur für PSP-Elemente mit Einträgen in "Kontostand Jahr"
-    def calculate_cumsum(group):
-        if group['Kontostand Jahr'].notna().any():
-            group['End Kontostand DM'] = group['Kontostand Jahr'].fillna(0).cumsum()
-        else:
-            group['End Kontostand DM'] = np.nan
-        return group
+    # Kontostände je PSP-Element berechnen (Verfahren über Config wählbar)
+    df_budget_kst_merged = kontostand_berechnen(df_budget_kst_merged, methode)
 
-    df_budget_kst_merged = df_budget_kst_merged.groupby('PSP').apply(calculate_cumsum).reset_index(drop=True)
+    return df_budget_merged, df_kst_merged, df_budget_kst_merged[prt]
 
-    # Budgetrest aus Vorjahr ein Jahr nach vorne schieben, Obligo abziehen und im Jahr davor als End-Kontostand angeben
-    def shift_kontostand(group):
-        group['End Kontostand Budget'] = group['Budgetrest aus Vorjahr'].shift(-1) - group['Festlegungen']
-        group.at[group.index[-1], 'End Kontostand Budget'] = 0
-        return group
 
-    df_budget_kst_merged = df_budget_kst_merged.groupby('PSP').apply(shift_kontostand).reset_index(drop=True)
+# Datenimport aus SAP CSV Tabellen (exporte: optionales Dictionary Datentyp -> Dateipfad, Bytes oder Dateiobjekt, das
+# die Pfade aus der Config ersetzt, z.B. für Uploads ohne temporäre Dateien)
+def import_sap_csv(config: LSControllingConfig, exporte=None):
+    # Festlegung der Datentypen (abweichend von standard)
+    cv_stammdaten = 'str'
+    cv_budget = {0: 'str', 2: 'str', 7: 'float', 8: 'float', 9: 'float'}
+    cv_obligo = {0: 'str', 3: 'str', 4: 'str', 7: 'float'}
+    cv_kst = {0: 'str', 1: 'str', 2: 'str', 3: 'float', 4: 'float', 5: 'float', 6: 'float', 7: 'float'}
 
-    # Erzeuge die neue Spalte 'Kontostand' nach dem Prinzip: wenn es ein Kontostand aus Drittmitteln gibt, nimm den,
-    # ansonsten den Kontostand, der aus dem Budget erzeugt wurde
-    def choose_kontostand(group):
-        if group['End Kontostand DM'].notna().any():
-            group['Kontostand'] = group['End Kontostand DM']
-        else:
-            group['Kontostand'] = group['End Kontostand Budget']
-        return group
+    daten = {'stammdaten': cv_stammdaten, 'budget': cv_budget, 'obligo': cv_obligo, 'kst': cv_kst}
+    exporte = {d: (exporte or dict()).get(d, config[f'csv_{d}']) for d in daten}
+
+    # CSV-Dateien parallel laden (jede Datei wird nur einmal gelesen). Wenn die Header geprüft werden sollen, wird
+    # ebenfalls das Erstelldatum zurückgeliefert. Fehler werden in der Reihenfolge der Dateien gemeldet. Budget und
+    # Obligo werden bei gesetztem import_blockzeilen blockweise gelesen und dabei bereits summiert.
+    block_zeilen = config['import_blockzeilen']
+    with ThreadPoolExecutor(max_workers=len(daten)) as pool:
+        futures = {d: pool.submit(load_sap_export_summiert, exporte[d], d, config[f'header_{d}'], cv,
+                                  config[f'check_{d}'], block_zeilen)
+                   if block_zeilen and d in bewegungsspalten else
+                   pool.submit(load_sap_export, exporte[d], d, config[f'header_{d}'], cv, config[f'check_{d}'])
+                   for d, cv in daten.items()}
+        geladen = dict()
+        for d, f in futures.items():
+            try:
+                geladen[d] = f.result()
+            except (pd.errors.EmptyDataError, FileNotFoundError) as e:
+                raise csv_ladefehler(exportname(exporte[d], d), e) from e
+
+    rep_data = ""
+    for d in daten:
+        if geladen[d][1] is not None:
+            rep_data += str(geladen[d][1]) + "\n"
+
+    df_stammdaten = geladen['stammdaten'][0]
+    df_budget = geladen['budget'][0]
+    df_obligo = geladen['obligo'][0]
+    df_kst = geladen['kst'][0]
+
+    # Daten vorab bereinigen (alle Zeilen löschen, die ein Ergebnis oder Gesamtergebnis sind), relevante Spalten
+    # auswählen und NaN mit 0 ersetzen. Blockweise gelesenes Budget und Obligo sind bereits bereinigt und summiert.
+    df_budget_relevant = df_budget if block_zeilen else bewegungen_bereinigen(df_budget, 'budget')
+    df_obligo_relevant = df_obligo if block_zeilen else bewegungen_bereinigen(df_obligo, 'obligo')
+    df_kst = not_cont(df_kst, 2, 'Ergebnis')
+    df_kst = df_kst[df_kst[0] != 'Gesamtergebnis']
+
+    # Auswahl und Sortierung von relevanten Spalten der einzelnen Tabellen und NaN mit 0 ersetzen
+    df_stammdaten_relevant = df_stammdaten[[3, 4, 2, 7, 10]]
+    df_kst_relevant = df_kst[[0, 1, 2, 3, 4, 5, 6, 7]].fillna(0)
+
+    # neue Spaltenüberschriften nach dem Filtern setzen
+    df_stammdaten_relevant.columns = ['PSP', 'PSPName', 'Status', 'Projektende', 'Geldgeber']
+    df_kst_relevant.columns = ['PSP', 'PSPName', 'Jahr', 'Einnahmen ILA', 'Einnahmen-Ist',
+                               'Eigen- und Industrieanteile', 'Ausgaben-Ist', 'Kontostand Jahr']
+
+    # IKZ der Datensätze prüfen (es müssen alle aus allen Datensätzen gleich sein). Im Batch-Modus sind mehrere IKZ
+    # erlaubt, maßgeblich sind dann alle IKZ aus den Stammdaten
+    batch = config['batch_modus']
+    ikz_stammdaten = get_ikz(df_stammdaten_relevant, batch)
+    ikz_budget = get_ikz(df_budget_relevant, batch)
+    ikz_obligo = get_ikz(df_obligo_relevant, batch)
+    ikz_kst = get_ikz(df_kst_relevant, batch)
+
+    if not batch and not (ikz_stammdaten == ikz_budget == ikz_obligo == ikz_kst):
+        raise DatensatzFehler("Die IKZ-Werte der vier Input Dateien stimmen nicht überein!")
+    ikz = ikz_stammdaten
+    praefix = 'Batch' if batch else ikz
+
+    # Bereinigen und Gruppieren nach Ergebnissen pro Jahr
+    df_budget_relevant = df_budget_relevant.groupby(['PSP', 'PSPName', 'Jahr']).sum(numeric_only=True).reset_index()
+    df_obligo_relevant = df_obligo_relevant.groupby(['PSP', 'PSPName', 'Jahr']).sum(numeric_only=True).reset_index()
+    df_kst_relevant = df_kst_relevant.groupby(['PSP', 'PSPName', 'Jahr']).sum(numeric_only=True).reset_index()
 
-    df_budget_kst_merged = df_budget_kst_merged.groupby('PSP').apply(choose_kontostand).reset_index(drop=True)
+    # Prüfen, ob mehr als ein Jahr enthalten ist
+    check_jahr(df_budget_relevant)
+    check_jahr(df_kst_relevant)
 
-    # Auswahl der Ausdrucke im Detailbericht
-    prt = ['PSP', 'PSPName', 'PA', 'Status', 'Geldgeber', 'Projektende', 'Jahr', 'Budgetrest aus Vorjahr',
-           'Originalbudget', 'Sonstige Zuweisungen', 'Festlegungen', 'End Kontostand Budget', 'Einnahmen-Ist',
-           'Einnahmen ILA', 'Eigen- und Industrieanteile', 'Ausgaben-Ist', 'Kontostand Jahr', 'End Kontostand DM',
-           'Kontostand']
+    # Stammdaten, Budget, Obligo und Drittmittelkontostand zusammenführen und Kontostände berechnen (im inkrementellen
+    # Modus nur für die PSP-Elemente, die sich seit dem letzten Lauf geändert haben)
+    quellen = {'stammdaten': df_stammdaten_relevant, 'budget': df_budget_relevant, 'obligo': df_obligo_relevant,
+               'kst': df_kst_relevant}
+    if config['inkrementell'] and not config['prt_raw'] and not config['obfuscated']:
+        df_budget_kst_merged = InkrementellerImport(config, ikz).berechnen(quellen)
+    else:
+        df_budget_merged, df_kst_merged, df_budget_kst_merged = import_zusammenfuehren(quellen,
+                                                                                      config['kontostand_methode'])
 
     # finales Dataframe für Ausgabe filtern
-    df_budget_kst_merged = (df_budget_kst_merged[prt].
+    df_budget_kst_merged = (df_budget_kst_merged.
                             sort_values(by=['PA', 'Projektende', 'PSP', 'Jahr', 'Status'],
                                         ascending=[True, True, True, True, True]))
 
@@ -372,9 +960,9 @@ def import_sap_csv(config: LSControllingConfig):
 
     # Rohdaten schreiben, wenn gewünscht
     if config['prt_raw']:
-        write_csv(df_budget_merged, ikz + '_Budget.csv')
-        write_csv(df_kst_merged, ikz + '_Drittmittelkontostand.csv')
-        write_csv(df_budget_kst_merged, ikz + '_Kombi_Budget_Drittmittelkontostand.csv')
+        write_csv(df_budget_merged, praefix + '_Budget.csv')
+        write_csv(df_kst_merged, praefix + '_Drittmittelkontostand.csv')
+        write_csv(df_budget_kst_merged, praefix + '_Kombi_Budget_Drittmittelkontostand.csv')
 
     # --- Datensatz verfremden für Testzwecke, wenn "obfuscated"-Flag gesetzt
     if config['obfuscated']:
@@ -392,38 +980,333 @@ def import_sap_csv(config: LSControllingConfig):
             return df
 
         # Verschleierten Datensatz zurückliefern
-        return "000000", obfuscate_psp(add_noise_to_numbers(df_budget_kst_merged)), ""
+        return ["000000"] if batch else "000000", kompakt(obfuscate_psp(add_noise_to_numbers(df_budget_kst_merged))), ""
     else:
-        # nicht-verfremdeten Datensatz zurückliefern
-        return ikz, df_budget_kst_merged, rep_data
+        # nicht-verfremdeten Datensatz zurückliefern (kompakte Darstellung, siehe kompakt)
+        return ikz, kompakt(df_budget_kst_merged), rep_data
+
+
+# Parquet Datei lesen; fehlende Texte kommen dabei als None zurück und werden wie beim CSV-Import wieder zu NaN
+def parquet_lesen(pfad):
+    df = pd.read_parquet(pfad)
+    texte = df.select_dtypes(include='object').columns
+    df[texte] = df[texte].fillna(np.nan)
+    return df
+
+
+# Schlüssel für den Import-Cache aus den Inhalten der SAP Dateien und den ergebnisrelevanten Optionen erzeugen
+# (exporte: wie bei import_sap_csv, Dateiobjekte müssen vorher mit export_lesen gelesen werden)
+def import_cache_schluessel(config: LSControllingConfig, exporte=None):
+    h = hashlib.sha256(f"{program_version}|{config['rm_beendet']}|{config['rm_current_year']}|"
+                       f"{config['batch_modus']}".encode())
+    try:
+        for d in ['stammdaten', 'budget', 'obligo', 'kst']:
+            h.update(f"|{d}|{config[f'header_{d}']}|{config[f'check_{d}']}|".encode())
+            quelle = (exporte or dict()).get(d, config[f'csv_{d}'])
+            if not isinstance(quelle, (str, os.PathLike)):
+                h.update(quelle)
+                continue
+            with open(quelle, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    h.update(block)
+    except OSError:
+        # fehlende Dateien werden beim eigentlichen Import gemeldet
+        return None
+    return h.hexdigest()
+
+
+# Datenimport mit Cache: bei unveränderten SAP Dateien und Optionen wird das Ergebnis direkt aus dem Cache geladen
+# (exporte: wie bei import_sap_csv)
+def import_sap_csv_cached(config: LSControllingConfig, exporte=None):
+    # Cache umgehen, wenn abgeschaltet oder wenn der Import Nebeneffekte hat (Rohdaten schreiben, Verfremdung)
+    if not config['import_cache'] or config['prt_raw'] or config['obfuscated']:
+        return import_sap_csv(config, exporte)
+
+    # Dateiobjekte lassen sich nur einmal lesen, deshalb vorab in Bytes umwandeln (Schlüssel und Import)
+    exporte = {d: q if isinstance(q, (str, os.PathLike)) else export_lesen(q) for d, q in (exporte or dict()).items()}
+    schluessel = import_cache_schluessel(config, exporte)
+    if schluessel is None:
+        return import_sap_csv(config, exporte)
+
+    cache = DateiCache(os.path.join(config['cache_verzeichnis'], 'import'), config['cache_max_mb'])
+    if cache.vorhanden(schluessel, ['.parquet', '.json']):
+        try:
+            with open(cache.pfad(schluessel, '.json'), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            return meta['ikz'], kompakt(parquet_lesen(cache.pfad(schluessel, '.parquet'))), meta['rep_dates']
+        except Exception as e:
+            print(f"Warnung: Import-Cache nicht lesbar ({e}), Daten werden neu importiert.")
+            cache.loeschen(schluessel)
+
+    ikz, df_ikz, rep_dates = import_sap_csv(config, exporte)
+
+    def meta_schreiben(pfad):
+        with open(pfad, 'w', encoding='utf-8') as f:
+            json.dump({'ikz': ikz, 'rep_dates': rep_dates}, f)
+
+    try:
+        cache.schreiben(schluessel, '.parquet', df_ikz.to_parquet)
+        cache.schreiben(schluessel, '.json', meta_schreiben)
+        cache.aufraeumen()
+    except ImportError as e:
+        print(f"Warnung: Import-Cache nicht verfügbar ({e}).")
 
+    return ikz, df_ikz, rep_dates
 
-# Daten zum Detailplot extrahieren
-def import_detail_plot(df, fn_detailplot, lst):
-    if os.path.exists(fn_detailplot):
+
+# Prüfsummen der Zeilen je PSP-Element (abhängig von Inhalt und Reihenfolge der Zeilen), liefert ein Dictionary
+# PSP -> Prüfsumme als Hex-Text. Sortiert und gruppiert wird über den PSP als Text, da die Spalte neben Texten auch
+# Zahlen enthalten kann (z.B. 0 für die Gesamtergebniszeile im Budget nach fillna)
+def psp_pruefsummen(df):
+    if df.empty:
+        return dict()
+    psp = df['PSP'].astype(str)
+    reihenfolge = np.argsort(psp.to_numpy(), kind='stable')
+    df = df.iloc[reihenfolge]
+    psp = psp.to_numpy()[reihenfolge]
+    zeilen = pd.util.hash_pandas_object(df.assign(_position=df.groupby(psp).cumcount()), index=False).to_numpy()
+    start = np.flatnonzero(np.r_[True, psp[1:] != psp[:-1]])
+    return {p: f"{h:016x}" for p, h in zip(psp[start], np.bitwise_xor.reduceat(zeilen, start))}
+
+
+# Inkrementeller Import: Zustand des letzten Laufs (zusammengeführte Zeilen inkl. Kontostand und Prüfsummen je
+# PSP-Element und Quelle) im Cache ablegen und beim nächsten Lauf nur die PSP-Elemente neu zusammenführen und
+# berechnen, die sich in mindestens einer Quelle geändert haben. Das Ergebnis entspricht dem vollständigen Import.
+# Der Zustand gehört zur IKZ (im Batch-Modus zur Liste der IKZ), nicht zu den Dateipfaden, so dass z.B. umbenannte
+# oder an anderer Stelle abgelegte Exporte derselben IKZ ihn weiter nutzen. Gleichzeitige Läufe für dieselbe IKZ (wie
+# im HTTP-Dienst) würden sich den Zustand gegenseitig überschreiben und sind deshalb ohne inkrementellen Import.
+class InkrementellerImport:
+    def __init__(self, config: LSControllingConfig, ikz):
+        self.methode = config['kontostand_methode']
+        self.cache = DateiCache(os.path.join(config['cache_verzeichnis'], 'inkrementell'), config['cache_max_mb'])
+
+        # ein Zustand je IKZ und Header-Einstellungen, Inhalte werden über die Prüfsummen verglichen
+        ikz = ','.join(ikz) if isinstance(ikz, list) else ikz
+        h = hashlib.sha256(f"{program_version}|{self.methode}|{ikz}".encode())
+        for d in ['stammdaten', 'budget', 'obligo', 'kst']:
+            h.update(f"|{d}|{config[f'header_{d}']}".encode())
+        self.schluessel = h.hexdigest()
+
+    # Zustand des letzten Laufs laden (None, wenn keiner vorhanden oder lesbar ist)
+    def laden(self):
+        if not self.cache.vorhanden(self.schluessel, ['.parquet', '.json']):
+            return None
+        try:
+            with open(self.cache.pfad(self.schluessel, '.json'), 'r', encoding='utf-8') as f:
+                pruefsummen = json.load(f)
+            return parquet_lesen(self.cache.pfad(self.schluessel, '.parquet')), pruefsummen
+        except Exception as e:
+            print(f"Warnung: Zustand für den inkrementellen Import nicht lesbar ({e}), Daten werden neu berechnet.")
+            self.cache.loeschen(self.schluessel)
+            return None
+
+    def speichern(self, df, pruefsummen):
+        def pruefsummen_schreiben(pfad):
+            with open(pfad, 'w', encoding='utf-8') as f:
+                json.dump(pruefsummen, f)
+
+        try:
+            self.cache.schreiben(self.schluessel, '.parquet', df.to_parquet)
+            self.cache.schreiben(self.schluessel, '.json', pruefsummen_schreiben)
+            self.cache.aufraeumen()
+        except ImportError as e:
+            print(f"Warnung: Zustand für den inkrementellen Import kann nicht gespeichert werden ({e}).")
+
+    # Quellen (siehe import_zusammenfuehren) zusammenführen, dabei unveränderte PSP-Elemente aus dem letzten Lauf
+    # übernehmen
+    def berechnen(self, quellen):
+        pruefsummen = {q: psp_pruefsummen(df) for q, df in quellen.items()}
+        zustand = self.laden()
+        if zustand is None:
+            df = import_zusammenfuehren(quellen, self.methode)[2]
+            self.speichern(df, pruefsummen)
+            return df
+
+        df_alt, pruefsummen_alt = zustand
+
+        # geänderte, neue und entfallene PSP-Elemente je Quelle ermitteln
+        geaendert = dict()
+        for q in quellen:
+            alt = pruefsummen_alt.get(q, dict())
+            geaendert[q] = {p for p in pruefsummen[q].keys() | alt.keys() if pruefsummen[q].get(p) != alt.get(p)}
+        alle = set().union(*geaendert.values())
+        LogContext.meldung(f"Inkrementeller Import: {len(alle)} geänderte PSP-Elemente ("
+                           f"{', '.join(f'{q}: {len(psp)}' for q, psp in geaendert.items())})")
+        if not alle:
+            return df_alt
+
+        # nur die geänderten PSP-Elemente neu berechnen; die Zeilen eines PSP-Elements stehen wie im vollständigen
+        # Import stabil nach PSP sortiert zusammen
+        teil = {q: df[df['PSP'].astype(str).isin(alle)] for q, df in quellen.items()}
+        neu = import_zusammenfuehren(teil, self.methode)[2]
+        unveraendert = df_alt[~df_alt['PSP'].astype(str).isin(alle)]
+        teile = [t for t in [unveraendert, neu] if len(t)] or [neu]
+        df = pd.concat(teile, ignore_index=True).sort_values('PSP', kind='stable').reset_index(drop=True)
+
+        self.speichern(df, pruefsummen)
+        return df
+
+
+# Datensatz nach IKZ (PSP[5:11]) aufteilen, liefert ein Dictionary IKZ -> Teildatensatz
+def ikz_aufteilen(df):
+    return {ikz: teil for ikz, teil in df.groupby(df['PSP'].str[5:11], sort=True)}
+
+
+# Daten zum Detailplot extrahieren (wenn eine IKZ gegeben ist, werden PSP-Elemente anderer IKZ ohne Warnung übergangen).
+# fn_detailplot: Dateipfad (wird übergangen, wenn die Datei fehlt), Bytes oder Dateiobjekt
+def import_detail_plot(df, fn_detailplot, lst, ikz=None):
+    if isinstance(fn_detailplot, (str, os.PathLike)):
+        vorhanden = os.path.exists(fn_detailplot)
+    else:
+        vorhanden = fn_detailplot is not None
+    if vorhanden:
         cv_detailplot = {0: 'str'}
         df_detailplot = load_csv_with_dynamic_header(fn_detailplot, 1, cv_detailplot)
         for index, row in df_detailplot.iterrows():
+            if ikz and str(row[0])[5:11] != ikz:
+                continue
             result = df[df['PSP'] == row[0]]
             if not result.empty:
                 res = [df, result['PSP'].iloc[0], f"{result['PSPName'].iloc[0]} ({result['PSP'].iloc[0]})", False]
                 lst.append(res)
             else:
-                print(f"Warnung: PSP {row[0]} in der Datei {fn_detailplot} ignoriert, da es nicht im SAP-Auszug ist.")
+                print(f"Warnung: PSP {row[0]} in der Datei {exportname(fn_detailplot, 'detailplot')} ignoriert, da es "
+                      f"nicht im SAP-Auszug ist.")
 
 
 # Alle Projektarten im Datensatz zu der Auswertung hinzufügen
 def import_pa_sap(df, lst):
-    pa = df.groupby(['PA']).last().reset_index()[['PA']]
+    pa = df.groupby(['PA'], observed=True).last().reset_index()[['PA']]
     for index, row in pa.iterrows():
         res = [df, PABericht.pa_pattern(row['PA']), f"Projektart {row['PA']}"]
         lst.append(res)
 
 
-# Matplotlib Diagramm erstellen
-def plot_pa(df, filename, title):
+# Würfel der Jahressummen nach Projektart, Kontoart (Sammel- oder Einzelkonto) und Laufzeit (Projektende vor oder nach
+# dem Cutoff). Alle Zeilen werden einmalig gekennzeichnet und in einem Durchlauf aggregiert; die Sub-Berichte werden
+# anschließend nur noch aus dem Würfel ausgeschnitten, statt den gesamten Datensatz jedes Mal neu zu filtern.
+class PAWuerfel:
+    # Aggregationsebenen des Würfels (Summen über Kontoart bzw. Laufzeit werden direkt aus den Zeilen gebildet, damit
+    # die Summationsreihenfolge der Filterung über cont() und nur_sammelkonten() etc. entspricht)
+    ebenen = [('PA', 'Konto', 'Laufzeit'), ('PA', 'Konto'), ('PA',)]
+
+    def __init__(self, df, cutoff):
+        self.df = df
+
+        # Kennzeichnung der Zeilen: PA nur bei gültigem 15-stelligen PSP (entspricht pa_pattern), Sammelkonten wie in
+        # nur_sammelkonten(), Laufzeit wie in laufende_projekte_ignorieren() und nur_laufende_projekte()
+        psp_gueltig = df['PSP'].astype(str).str.fullmatch(r'\d{15}')
+        sammelkonto = df['Geldgeber'].astype(str).str.fullmatch('999|1')
+        self.merkmale = pd.DataFrame({
+            'PA': df['PA'].where(psp_gueltig),
+            'Konto': np.where(sammelkonto, 'Sammelkonto', 'Einzelkonto'),
+            'Laufzeit': np.select([df['Projektende'] <= cutoff, df['Projektende'] > cutoff],
+                                  ['abgelaufen', 'laufend'], 'unbekannt'),
+        }, index=df.index)
+
+        daten = pd.concat([self.merkmale, df['Jahr'], df.select_dtypes(include='number')], axis=1)
+        self.spalten = ['Jahr'] + list(df.select_dtypes(include='number').columns)
+        self.wuerfel = {e: daten.groupby(list(e) + ['Jahr'], observed=True).sum(numeric_only=True) for e in self.ebenen}
+
+    # Jahressummen für eine Projektart ausschneiden (Kontoart und Laufzeit optional, None = alle)
+    def auswahl(self, pa, konto=None, laufzeit=None):
+        werte = [str(pa)] + [w for w in [konto, laufzeit] if w is not None]
+        ebene = ('PA', 'Konto', 'Laufzeit') if laufzeit is not None else ('PA', 'Konto') if konto else ('PA',)
+
+        # Projektarten, die nicht zweistellig sind, passen nicht auf PSP[3:5]; hier wie bisher über das Muster filtern
+        if len(werte[0]) != 2:
+            maske = pd.Series(True, index=self.df.index)
+            for spalte, wert in zip(ebene[1:], werte[1:]):
+                maske &= self.merkmale[spalte] == wert
+            df = cont(self.df[maske], 'PSP', PABericht.pa_pattern(pa))
+            return df.groupby('Jahr').sum(numeric_only=True).reset_index()
+
+        try:
+            gdf = self.wuerfel[ebene].xs(tuple(werte), level=list(range(len(werte))))
+        except KeyError:
+            return pd.DataFrame(columns=self.spalten)
+        return gdf.reset_index()
+
+
+# Persistenter Cache für Diagramme, adressiert über den Inhalt: Schlüssel ist eine Prüfsumme aus den dargestellten
+# Jahren und Kontoständen, dem Titel, dem Backend und der Programmversion. Unveränderte Diagramme (z.B. abgeschlossener
+# Projekte) werden so über Läufe hinweg nicht neu gezeichnet. Abgelegt wird das bereits aus dem SVG umgewandelte
+# reportlab Drawing (als Pickle, vor dem Skalieren), damit Treffer weder matplotlib noch svg2rlg benötigen; nur für
+# das Backend 'matplotlib', reportlab Diagramme sind schnell genug erzeugt. Bei Überschreiten von cache_max_mb werden
+# die am längsten nicht genutzten Diagramme gelöscht.
+class DiagrammCache:
+    def __init__(self, config: LSControllingConfig):
+        self.backend = config['diagramm_backend']
+        self.cache = DateiCache(os.path.join(config['cache_verzeichnis'], 'diagramme'), config['cache_max_mb'])
+        self.treffer = 0
+        self.anfragen = 0
+
+    def schluessel(self, df, title):
+        h = hashlib.sha256(f"{program_version}|{self.backend}|{title}|".encode())
+        h.update('|'.join(df['Jahr'].astype(str)).encode())
+        h.update(df['Kontostand'].to_numpy(dtype='float64').tobytes())
+        return h.hexdigest()
+
+    # Diagramm als reportlab Drawing aus dem Cache holen (None, wenn nicht vorhanden oder nicht lesbar)
+    def holen(self, df, title):
+        if self.backend != 'matplotlib':
+            return None
+        self.anfragen += 1
+        schluessel = self.schluessel(df, title)
+        if not self.cache.vorhanden(schluessel, ['.pkl']):
+            return None
+        try:
+            with open(self.cache.pfad(schluessel, '.pkl'), 'rb') as f:
+                plot = pickle.load(f)
+        except Exception:
+            self.cache.loeschen(schluessel)
+            return None
+        self.treffer += 1
+        return plot
+
+    # Diagramm (reportlab Drawing, noch nicht skaliert) ablegen
+    def ablegen(self, df, title, plot):
+        if self.backend != 'matplotlib':
+            return
+        schluessel = self.schluessel(df, title)
+        if not self.cache.vorhanden(schluessel, ['.pkl']):
+            def schreiben(pfad):
+                with open(pfad, 'wb') as f:
+                    pickle.dump(plot, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+            self.cache.schreiben(schluessel, '.pkl', schreiben)
+
+    # Maximalgröße einhalten (einmal nach allen Sub-Berichten statt nach jedem Diagramm)
+    def aufraeumen(self):
+        self.cache.aufraeumen()
+        if LogContext.aktiv and self.anfragen:
+            print(f"{self.treffer} von {self.anfragen} Diagrammen aus dem Cache übernommen")
+
+
+# Diagramm des Kontostands über die Jahre mit dem gewählten Backend erstellen (Kontostand in Cent oder Euro). Rückgabe
+# sind beim Backend 'matplotlib' die SVG-Daten, beim Backend 'reportlab' direkt ein reportlab Drawing (None, wenn keine
+# Daten vorliegen).
+def plot_pa(df, title, backend='matplotlib'):
+    backends = {
+        'matplotlib': plot_pa_matplotlib,
+        'reportlab': plot_pa_reportlab
+    }
+
+    if backend not in backends:
+        raise KonfigurationsFehler(f"Unbekanntes Diagramm-Backend '{backend}'! Erlaubt sind: {', '.join(backends)}")
+    return backends[backend](betraege_in_euro(df), title)
+
+
+# Matplotlib Diagramm als SVG im Speicher erstellen, Rückgabe sind die SVG-Daten (None, wenn keine Daten vorliegen).
+# Läuft ggf. in einem separaten Prozess, daher hier das SVG-Backend setzen.
+def plot_pa_matplotlib(df, title):
     if df.empty:
-        return False
+        return None
+
+    import matplotlib
+    import matplotlib.pyplot as plt
+    import matplotlib.backends.backend_svg  # Importiert das Backend explizit (für PyInstaller wichtig!)
+    matplotlib.use('svg')
 
     # Setze das Jahr als Index
     df = df.set_index('Jahr')
@@ -446,12 +1329,12 @@ def plot_pa(df, filename, title):
         reg_coeff = np.polyfit(x, y, deg=1)
         poly_eqn = np.poly1d(reg_coeff)
         y_pred = poly_eqn(x)
-        slope = locale.format_string('%.2f €/J', reg_coeff[0], grouping=True)  # Steigung der Regressionsgeraden
+        slope = euro(reg_coeff[0], ' €/J')  # Steigung der Regressionsgeraden
         plt.plot(df.index, y_pred, '--', color='#F6A800', lw=2.0, label=f'Lin. Regression ({slope})')
 
     # Mittelwert-Linie (punkt-gestrichelt)
     mean_value = y.mean()
-    mean_value_form = locale.format_string('%.2f €', mean_value, grouping=True)
+    mean_value_form = euro(mean_value)
     plt.plot([df.index[0], df.index[-1]], [mean_value, mean_value], '-.', color='#BDCD00', lw=2.0,
              label=f'Mittelwert ({mean_value_form})')
 
@@ -460,29 +1343,217 @@ def plot_pa(df, filename, title):
     plt.xlabel("Jahr")
     plt.ylabel("Kontostand [€]")
     plt.legend()
-    plt.savefig(filename)
+    buffer = io.BytesIO()
+    plt.savefig(buffer, format='svg')
     plt.close()
 
-    return True
+    return buffer.getvalue()
+
+
+# Gut lesbare Achsenbeschriftung ermitteln (Schrittweite 1, 2, 2.5 oder 5 mal Zehnerpotenz, ähnlich zu matplotlib)
+def achsen_ticks(vmin, vmax, anzahl=8):
+    spanne = vmax - vmin
+    if spanne <= 0:
+        spanne = abs(vmax) or 1
+    roh = spanne / anzahl
+    basis = 10 ** math.floor(math.log10(roh))
+    schritt = next(m * basis for m in (1, 2, 2.5, 5, 10) if roh <= m * basis)
+    return [k * schritt for k in range(math.ceil(vmin / schritt), math.floor(vmax / schritt) + 1)]
+
+
+# Diagramm direkt aus reportlab Grafikelementen erstellen (ohne matplotlib und ohne SVG-Umweg). Aufbau, Farben und
+# Linienstile entsprechen dem matplotlib Diagramm: Kontostand als Linie mit gefüllter Fläche, lineare Regression
+# (gestrichelt) und Mittelwert (punkt-gestrichelt). Rückgabe ist ein Drawing in der Größe des matplotlib Diagramms.
+def plot_pa_reportlab(df, title):
+    if df.empty:
+        return None
+
+    from reportlab.graphics.shapes import Drawing, Group, Line, PolyLine, Polygon, Circle, Rect, String
+    from reportlab.lib import colors
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+
+    jahre = [str(j) for j in df['Jahr']]
+    y = df['Kontostand'].to_numpy(dtype=float)
+    x = np.arange(len(y))
+
+    # Lineare Regression und Mittelwert wie im matplotlib Diagramm
+    linien = []
+    if len(y) > 1:
+        reg_coeff = np.polyfit(x, y, deg=1)
+        slope = euro(reg_coeff[0], ' €/J')  # Steigung der Regressionsgeraden
+        linien.append((np.poly1d(reg_coeff)(x), '#F6A800', [7.4, 3.2], f'Lin. Regression ({slope})'))
+    mean_value = y.mean()
+    mean_value_form = euro(mean_value)
+    linien.append((np.array([mean_value, mean_value]), '#BDCD00', [12.8, 3.2, 2, 3.2],
+                   f'Mittelwert ({mean_value_form})'))
+
+    # Zeichenfläche (10 x 5 Zoll wie matplotlib) und Achsenbereich (Standardränder von matplotlib)
+    breite, hoehe = 720, 360
+    x0, x1, y0, y1 = 0.125 * breite, 0.9 * breite, 0.11 * hoehe, 0.88 * hoehe
+
+    # Wertebereiche inkl. 5 % Rand; die gefüllte Fläche reicht bis 0
+    alle_y = np.concatenate([y, [0]] + [lin[0] for lin in linien])
+    ymin, ymax = alle_y.min(), alle_y.max()
+    if ymax == ymin:
+        ymin, ymax = ymin - 1, ymax + 1
+    yrand = 0.05 * (ymax - ymin)
+    ymin, ymax = ymin - yrand, ymax + yrand
+    xrand = 0.05 * (len(y) - 1) if len(y) > 1 else 0.5
+    xmin, xmax = -xrand, len(y) - 1 + xrand
+
+    def px(wert):
+        return x0 + (wert - xmin) / (xmax - xmin) * (x1 - x0)
+
+    def py(wert):
+        return y0 + (wert - ymin) / (ymax - ymin) * (y1 - y0)
+
+    blau = colors.HexColor('#00549F')
+    d = Drawing(breite, hoehe)
+    d.add(Rect(0, 0, breite, hoehe, fillColor=colors.white, strokeColor=None))
+
+    # Fläche unter der Kontostandslinie (bis zur Nulllinie)
+    punkte = [(px(i), py(v)) for i, v in zip(x, y)]
+    flaeche = punkte + [(px(x[-1]), py(0)), (px(x[0]), py(0))]
+    d.add(Polygon([k for p in flaeche for k in p], fillColor=colors.Color(blau.red, blau.green, blau.blue, alpha=0.25),
+                  strokeColor=None))
+
+    # Kontostandslinie mit Markern
+    d.add(PolyLine([k for p in punkte for k in p], strokeColor=blau, strokeWidth=1.5))
+    for p in punkte:
+        d.add(Circle(p[0], p[1], 3, fillColor=blau, strokeColor=blau, strokeWidth=1))
+
+    # Regression (über alle Jahre) und Mittelwert (vom ersten bis zum letzten Jahr)
+    for werte, farbe, strich, _ in linien:
+        xs = x if len(werte) == len(x) else [x[0], x[-1]]
+        d.add(PolyLine([k for i, v in zip(xs, werte) for k in (px(i), py(v))], strokeColor=colors.HexColor(farbe),
+                       strokeWidth=2, strokeDashArray=strich))
+
+    # Achsenrahmen und Beschriftungen
+    d.add(Rect(x0, y0, x1 - x0, y1 - y0, fillColor=None, strokeColor=colors.black, strokeWidth=0.8))
+    for i, jahr in enumerate(jahre):
+        d.add(Line(px(i), y0, px(i), y0 - 3.5, strokeColor=colors.black, strokeWidth=0.8))
+        d.add(String(px(i), y0 - 15, jahr, fontName='Helvetica', fontSize=10, textAnchor='middle'))
+    beschriftungen = []
+    for t in achsen_ticks(ymin, ymax):
+        text = euro(t, '', nachkommastellen=0) if abs(t) >= 1 or t == 0 else f"{t:g}".replace('.', ',')
+        beschriftungen.append(text)
+        d.add(Line(x0, py(t), x0 - 3.5, py(t), strokeColor=colors.black, strokeWidth=0.8))
+        d.add(String(x0 - 7, py(t) - 3.5, text, fontName='Helvetica', fontSize=10, textAnchor='end'))
+
+    d.add(String((x0 + x1) / 2, y0 - 31, "Jahr", fontName='Helvetica', fontSize=10, textAnchor='middle'))
+    ylabel_x = x0 - 14 - max(stringWidth(b, 'Helvetica', 10) for b in beschriftungen) if beschriftungen else x0 - 30
+    ylabel = Group(String(0, 0, "Kontostand [€]", fontName='Helvetica', fontSize=10, textAnchor='middle'))
+    ylabel.translate(ylabel_x, (y0 + y1) / 2)
+    ylabel.rotate(90)
+    d.add(ylabel)
+    if title:
+        d.add(String((x0 + x1) / 2, y1 + 6, title, fontName='Helvetica', fontSize=12, textAnchor='middle'))
+
+    # Legende in der Ecke mit den wenigsten überdeckten Datenpunkten (wie loc='best' bei matplotlib)
+    eintraege = [('Kontostand', blau, None, True)] + [(lin[3], colors.HexColor(lin[1]), lin[2], False)
+                                                      for lin in linien]
+    lb = 40 + max(stringWidth(e[0], 'Helvetica', 10) for e in eintraege)
+    lh = 8 + 15 * len(eintraege)
+    ecken = [(x1 - 7 - lb, y1 - 7 - lh), (x0 + 7, y1 - 7 - lh), (x0 + 7, y0 + 7), (x1 - 7 - lb, y0 + 7)]
+    alle_punkte = punkte + [(px(i), py(v)) for werte, _, _, _ in linien
+                            for i, v in zip(x if len(werte) == len(x) else [x[0], x[-1]], werte)]
+    lx, ly = min(ecken, key=lambda e: sum(e[0] <= p[0] <= e[0] + lb and e[1] <= p[1] <= e[1] + lh
+                                          for p in alle_punkte))
+    d.add(Rect(lx, ly, lb, lh, rx=3, ry=3, fillColor=colors.Color(1, 1, 1, alpha=0.8),
+               strokeColor=colors.HexColor('#CCCCCC'), strokeWidth=0.8))
+    for n, (text, farbe, strich, marker) in enumerate(eintraege):
+        ey = ly + lh - 4 - 15 * (n + 0.5)
+        d.add(Line(lx + 6, ey, lx + 30, ey, strokeColor=farbe, strokeWidth=1.5 if marker else 2,
+                   strokeDashArray=strich))
+        if marker:
+            d.add(Circle(lx + 18, ey, 3, fillColor=farbe, strokeColor=farbe, strokeWidth=1))
+        d.add(String(lx + 36, ey - 3.5, text, fontName='Helvetica', fontSize=10))
+
+    return d
 
 
 # Funktion zum Aggregieren der Daten nach Projekten
 def agg_proj(df):
     # Daten nach Projekten gruppieren und letzten Wert für die Kontostände nehmen
-    df1 = df.groupby(['PSP', 'PSPName', 'Status', 'Projektende', 'Geldgeber']).last().reset_index()
+    df1 = df.groupby(['PSP', 'PSPName', 'Status', 'Projektende', 'Geldgeber'], observed=True).last().reset_index()
     return df1[['PSP', 'PSPName', 'PA', 'Status', 'Projektende', 'Geldgeber', 'End Kontostand Budget',
                 'End Kontostand DM', 'Kontostand']].sort_values(by=['PA', 'Projektende', 'PSP', 'Status'],
                                                                 ascending=[True, True, True, True])
 
 
-# Text Reports schreiben
+# Text Reports schreiben (gepuffert, immer UTF-8 statt der Systemkodierung; die CSV-Dateien bleiben für Excel in cp1252)
 class TXTReport:
+    puffer = 1024 * 1024  # Größe des Schreibpuffers in Byte
+    blockgroesse = 5000  # Zeilen je Block beim Schreiben von Tabellen
+
+    # filename: Dateipfad oder Puffer (binär wie io.BytesIO, dann UTF-8, oder Text wie io.StringIO). Puffer bleiben nach
+    # finalize geöffnet und gehören weiter dem Aufrufer.
     def __init__(self, filename):
-        self.txt = open(filename, 'w')
+        self.datei = None
+        if isinstance(filename, io.TextIOBase):
+            self.txt = filename
+        elif hasattr(filename, 'write'):
+            self.txt = io.TextIOWrapper(filename, encoding='utf-8')
+        else:
+            self.datei = filename
+            self.txt = open(filename, 'w', encoding='utf-8', buffering=self.puffer)
 
     def append(self, text):
         self.txt.write(text)
 
+    # Spalte eines Tabellenblocks als Texte wie in DataFrame.to_string (datum: Datumsspalte ohne Uhrzeit ausgeben)
+    @staticmethod
+    def spalte_als_text(werte, datum=False):
+        if pd.api.types.is_datetime64_any_dtype(werte):
+            text = werte.dt.strftime('%Y-%m-%d' if datum else '%Y-%m-%d %H:%M:%S')
+            return text.where(werte.notna(), 'NaT')
+        text = werte.astype(str).str.replace('\t', '\\t').str.replace('\n', '\\n').str.replace('\r', '\\r')
+        fehlend = werte.isna().to_numpy()
+        return text.where(~fehlend, np.where(np.equal(werte.to_numpy(), None), 'None', 'NaN'))
+
+    # Tabelle im Layout von DataFrame.to_string(index=False) schreiben (ohne abschließenden Zeilenumbruch). Tabellen bis
+    # zur Blockgröße werden direkt über to_string geschrieben. Größere Tabellen werden blockweise genau einmal
+    # formatiert: die Texte eines Blocks gehen in eine temporäre Datei, während die Spaltenbreiten ermittelt werden,
+    # danach werden die Blöcke daraus bündig geschrieben. Der Speicherbedarf hängt so nur von der Blockgröße ab, nicht
+    # von der Anzahl der Zeilen. formatierung: optionale Funktion, die einen Block in Texte umwandelt (z.B. Geldbeträge
+    # mit euro_format); Spalten mit Zahlen müssen damit in Texte umgewandelt werden, ansonsten wird die Tabelle über
+    # to_string geschrieben.
+    def append_tabelle(self, df, formatierung=None):
+        formatierung = formatierung or (lambda block: block)
+        if len(df) <= self.blockgroesse:
+            self.append(formatierung(df).to_string(index=False))
+            return
+        spalten = formatierung(df.head(0)).dtypes
+        textspalten = all(pd.api.types.is_object_dtype(t) or pd.api.types.is_string_dtype(t) or
+                          isinstance(t, pd.CategoricalDtype) or pd.api.types.is_datetime64_any_dtype(t)
+                          for t in spalten)
+        if not textspalten:
+            self.append(formatierung(df).to_string(index=False))
+            return
+
+        # Datumsspalten wie bei to_string nur dann ohne Uhrzeit, wenn keine Uhrzeiten in der gesamten Spalte vorkommen
+        datum = {c: df[c].dropna().eq(df[c].dropna().dt.normalize()).all()
+                 for c, t in spalten.items() if pd.api.types.is_datetime64_any_dtype(t)}
+
+        breiten = [len(str(c)) for c in spalten.index]
+        with tempfile.TemporaryFile() as zwischenspeicher:
+            bloecke = 0
+            for start in range(0, len(df), self.blockgroesse):
+                block = formatierung(df.iloc[start:start + self.blockgroesse])
+                texte = [self.spalte_als_text(block[c], datum.get(c, False)) for c in block.columns]
+                breiten = [max(b, int(t.str.len().max())) for b, t in zip(breiten, texte)]
+                pickle.dump(texte, zwischenspeicher, protocol=pickle.HIGHEST_PROTOCOL)
+                bloecke += 1
+
+            self.append(' '.join(str(c).rjust(b) for c, b in zip(spalten.index, breiten)))
+            zwischenspeicher.seek(0)
+            for _ in range(bloecke):
+                texte = pickle.load(zwischenspeicher)
+                zeilen = texte[0].str.rjust(breiten[0])
+                for t, b in zip(texte[1:], breiten[1:]):
+                    zeilen = zeilen + ' ' + t.str.rjust(b)
+                self.append('\n' + '\n'.join(zeilen))
+
     # Überschrift schreiben
     def append_title(self, title):
         self.txt.write("-" * len(title) + f"\n{title}\n" + "-" * len(title) + "\n\n")
@@ -499,15 +1570,35 @@ class TXTReport:
             self.append(dates)
 
     def finalize(self):
-        self.txt.close()
+        if self.datei is not None:
+            self.txt.close()
+        elif isinstance(self.txt, io.TextIOWrapper):
+            self.txt.detach()  # schreibt den Rest in den Puffer, ohne ihn zu schließen
+        else:
+            self.txt.flush()
+
+    # Unvollständigen Bericht schließen und löschen (z.B. nach einem Fehler beim Schreiben); Puffer werden nur
+    # freigegeben, der Aufrufer erhält ja den Fehler
+    def verwerfen(self):
+        self.finalize()
+        if self.datei is not None and os.path.exists(self.datei):
+            os.remove(self.datei)
 
 
-# PDF Reports basierend auf reportlab schreiben
+# PDF Reports basierend auf reportlab schreiben (filename: Dateipfad oder binärer Puffer wie io.BytesIO;
+# kopfzeile: abweichender Text im Seitenkopf, querformat: A4 quer, z.B. für breite Tabellen)
 class PDFReport:
-    def __init__(self, filename, ikz):
-        self.pdf = SimpleDocTemplate(filename=filename, pagesize=A4, leftMargin=2 * cm,
+    def __init__(self, filename, ikz, kopfzeile=None, querformat=False):
+        from reportlab.lib import colors
+        from reportlab.lib.pagesizes import A4, landscape
+        from reportlab.lib.styles import getSampleStyleSheet
+        from reportlab.lib.units import cm
+        from reportlab.platypus import SimpleDocTemplate
+
+        self.pdf = SimpleDocTemplate(filename=filename, pagesize=landscape(A4) if querformat else A4, leftMargin=2 * cm,
                                      rightMargin=2 * cm, topMargin=3 * cm, bottomMargin=2 * cm)
         self.ikz = ikz
+        self.kopfzeile = kopfzeile or f"Controlling der IKZ {ikz}"
         self.styles = getSampleStyleSheet()
         self.pdf_elements = list()
         self.rwth_tab_style = [
@@ -521,8 +1612,13 @@ class PDFReport:
 
     # Funktion für den Header auf jeder Seite
     def lscontrolling_brand(self, canvas, doc):
+        from reportlab.graphics import renderPDF
+        from reportlab.lib.units import cm
+        from svglib.svglib import svg2rlg
+        from lscontrolling_logo import lscontrolling_logo
+
         # Seitenbreite und Ränder
-        page_width, page_height = A4
+        page_width, page_height = doc.pagesize
         margin_top = 1 * cm  # von der Oberkante
         margin_left = doc.leftMargin  # Verwendung der vom Dokument definierten linken Marge
         margin_right = doc.rightMargin  # Verwendung der vom Dokument definierten rechten Marge
@@ -548,7 +1644,7 @@ class PDFReport:
 
         # Text linksbündig platzieren
         canvas.setFont("Helvetica-Bold", 18)
-        text = f"Controlling der IKZ {self.ikz}"
+        text = self.kopfzeile
 
         # Der Text wird an der Unterkante des Logos ausgerichtet
         text_x = margin_left + 5
@@ -566,57 +1662,20 @@ class PDFReport:
         canvas.setFont("Helvetica", 10)
         canvas.drawString(footer_x, footer_y, footer_text)
 
-    # Funktion zum Einfärben der Beträge der Zusammenfassungstabelle
+    # Funktion zum Einfärben der Beträge der Zusammenfassungstabelle (eine Kategorie je Tabellenzeile ohne Kopfzeile,
+    # siehe Zusammenfassung.kategorien; spalte: Tabellenspalte der Beträge)
     @staticmethod
-    def zusammenfassungstabelle_farbe(table_data):
-        # Initialisiere eine leere Liste für die Stile
-        style = []
-        total_sum = 0
-
-        positive_green = 0
-        negative_red = 0
-        negative_orange = 0
-
-        # Konvertiert einen Euro-Betrag von String in eine Zahl zurück
-        def parse_euro_amount(amount_str: str) -> float:
-            try:
-                return float(amount_str.replace('.', '').replace(',', '.').replace('€', '').strip())
-            except ValueError:
-                return 0
-
-        # Durchlaufe alle Zellen in der Tabelle und prüfe ihren Inhalt
-        for row_idx, row in enumerate(table_data[:-1]):  # Die letzte Zeile (Summe) wird später behandelt.
-            projektart, bemerkung, kontostand_str = row
-
-            # Konvertiere den Kontostand-String in eine Zahl
-            kontostand = parse_euro_amount(kontostand_str)
-
-            if isinstance(kontostand, float):  # Prüfe, ob es sich um eine Zahl handelt
-                if kontostand < 0:
-                    color = colors.red if 'vor' in bemerkung.lower() or 'alle' in bemerkung.lower() else colors.orange
-                    style.append(('TEXTCOLOR', (2, row_idx), (2, row_idx), color))
-                    if color == colors.red:
-                        negative_red += kontostand
-                    else:
-                        negative_orange += kontostand
-                elif kontostand > 0:
-                    style.append(('TEXTCOLOR', (2, row_idx), (2, row_idx), colors.green))
-                    positive_green += kontostand
-
-            total_sum += kontostand
-
-        # Einfärben der finalen Summe
-        if total_sum > 0:
-            style.append(('TEXTCOLOR', (2, len(table_data) - 1), (2, len(table_data) - 1), colors.green))
-        else:
-            if total_sum - negative_orange >= 0:
-                style.append(('TEXTCOLOR', (2, len(table_data) - 1), (2, len(table_data) - 1), colors.orange))
-            else:
-                style.append(('TEXTCOLOR', (2, len(table_data) - 1), (2, len(table_data) - 1), colors.red))
+    def zusammenfassungstabelle_farbe(kategorien, spalte=2):
+        from reportlab.lib import colors
 
-        return style
+        farben = {'gruen': colors.green, 'orange': colors.orange, 'rot': colors.red}
+        return [('TEXTCOLOR', (spalte, zeile), (spalte, zeile), farben[kategorie])
+                for zeile, kategorie in enumerate(kategorien, start=1) if kategorie]
 
     def signature_lines(self, ikz):
+        from reportlab.lib.units import cm
+        from reportlab.platypus import Paragraph, KeepTogether
+
         p1 = Paragraph(
             "Ich habe diesen Bericht gesehen und zur Kenntnis genommen. Bei eventuellen Unklarheiten habe ich "
             "mich vor Unterschrift mit dem Dekanat abgestimmt.", self.styles['Normal'])
@@ -626,6 +1685,9 @@ class PDFReport:
         self.append(KeepTogether([p1, p2, p3]))
 
     def berichts_info(self, dates):
+        from reportlab.lib.units import cm
+        from reportlab.platypus import Paragraph, KeepTogether, PageBreak
+
         if dates != "":
             self.append(PageBreak())
             p1 = Paragraph("Informationen zu den Ausgangsberichten", self.styles['Normal'])
@@ -638,75 +1700,294 @@ class PDFReport:
         self.pdf_elements.append(element)
 
     def append_title(self, title):
+        from reportlab.platypus import Paragraph
         self.pdf_elements.append(Paragraph(title, self.styles['Heading1']))
 
     def append_title2(self, title):
+        from reportlab.platypus import Paragraph
         self.pdf_elements.append(Paragraph(title, self.styles['Heading2']))
 
     def finalize(self):
         self.pdf.build(self.pdf_elements, onFirstPage=self.lscontrolling_brand, onLaterPages=self.lscontrolling_brand)
 
 
+# Eintrag der Zusammenfassung: Kontostand eines Sub-Berichtes in Cent und Kategorie für die Einfärbung ('gruen' bei
+# positivem Kontostand, bei negativem 'rot' bzw. 'orange' für laufende Projekte, None bei einem Kontostand von 0)
+class ZusammenfassungEintrag:
+    def __init__(self, projektart, bemerkung, kontostand, laufend=False):
+        self.projektart = projektart
+        self.bemerkung = bemerkung
+        self.kontostand = kontostand
+        if kontostand > 0:
+            self.kategorie = 'gruen'
+        elif kontostand < 0:
+            self.kategorie = 'orange' if laufend else 'rot'
+        else:
+            self.kategorie = None
+
+
+# Zusammenfassung der Sub-Berichte. Die Beträge bleiben ganze Cent und werden erst bei der Ausgabe formatiert.
+class Zusammenfassung:
+    spalten = ['Projektart', 'Bemerkung', 'Kontostand']
+
+    def __init__(self):
+        self.eintraege = []
+
+    def __len__(self):
+        return len(self.eintraege)
+
+    def hinzufuegen(self, projektart, bemerkung, kontostand, laufend=False):
+        self.eintraege.append(ZusammenfassungEintrag(projektart, bemerkung, kontostand, laufend))
+
+    def summe(self):
+        return int(np.sum([e.kontostand for e in self.eintraege], dtype='int64'))
+
+    # Kategorie der Summe: 'gruen', wenn die Summe positiv ist, 'orange', wenn der Fehlbetrag allein aus laufenden
+    # Projekten stammt, ansonsten 'rot'
+    def summen_kategorie(self):
+        summe = self.summe()
+        if summe > 0:
+            return 'gruen'
+        orange = sum(e.kontostand for e in self.eintraege if e.kategorie == 'orange')
+        return 'orange' if summe - orange >= 0 else 'rot'
+
+    # Kategorien aller Zeilen inkl. der Summenzeile (in der Reihenfolge von tabelle())
+    def kategorien(self):
+        return [e.kategorie for e in self.eintraege] + [self.summen_kategorie()]
+
+    # Tabelle mit formatierten Beträgen und Summenzeile für TXT- und PDF-Bericht
+    def tabelle(self):
+        kontostand = [e.kontostand for e in self.eintraege] + [self.summe()]
+        return pd.DataFrame({
+            'Projektart': [e.projektart for e in self.eintraege] + ['Summe'],
+            'Bemerkung': [e.bemerkung for e in self.eintraege] + [''],
+            'Kontostand': euro_format(np.asarray(kontostand, dtype='int64') / 100),
+        }, columns=self.spalten)
+
+
+# Fakultätsweite Übersicht aus den Zusammenfassungen mehrerer IKZ (z.B. aus dem Batch-Modus): Matrix der Kontostände
+# je IKZ und Projektart mit Summenzeile und -spalte. Jede Zelle fasst die Einträge der Zusammenfassungen zusammen und
+# wird wie deren Summenzeile kategorisiert (siehe Zusammenfassung.summen_kategorie, bei einer Summe von 0 keine
+# Kategorie). Die Berichte der einzelnen IKZ werden dafür nicht erneut erzeugt.
+class Fakultaetsuebersicht:
+    def __init__(self, zusammenfassungen):
+        self.zusammenfassungen = dict(sorted(zusammenfassungen.items()))
+
+        # Projektarten in der Reihenfolge der Sub-Berichte, Einträge je IKZ und Projektart
+        self.projektarten = list(dict.fromkeys(e.projektart.strip() for z in self.zusammenfassungen.values()
+                                               for e in z.eintraege))
+        self.eintraege = {(ikz, p): [] for ikz in self.zusammenfassungen for p in self.projektarten}
+        for ikz, z in self.zusammenfassungen.items():
+            for e in z.eintraege:
+                self.eintraege[(ikz, e.projektart.strip())].append(e)
+
+    # Einträge einer Zelle als Zusammenfassung (IKZ bzw. Projektart None: Summe über alle)
+    def zelle(self, ikz=None, projektart=None):
+        zelle = Zusammenfassung()
+        for (i, p), eintraege in self.eintraege.items():
+            if ikz in (None, i) and projektart in (None, p):
+                zelle.eintraege += eintraege
+        return zelle
+
+    # Beträge in Cent (Int64, <NA> ohne Einträge) und Kategorien je IKZ (Zeilen) und Projektart (Spalten), jeweils inkl.
+    # Summe
+    def matrix(self):
+        zeilen = list(self.zusammenfassungen) + [None]
+        spalten = self.projektarten + [None]
+        zellen = [[self.zelle(i, p) for p in spalten] for i in zeilen]
+        index = pd.Index(list(self.zusammenfassungen) + ['Summe'], name='IKZ')
+        betraege = pd.DataFrame([[z.summe() if len(z) else None for z in zeile] for zeile in zellen],
+                                index=index, columns=self.projektarten + ['Summe'], dtype='Int64')
+        kategorien = pd.DataFrame([[z.summen_kategorie() if len(z) and z.summe() != 0 else None for z in zeile]
+                                   for zeile in zellen], index=index, columns=betraege.columns)
+        return betraege, kategorien
+
+    # Tabelle mit formatierten Beträgen (ohne Einheit) für TXT- und PDF-Bericht
+    def tabelle(self):
+        betraege = self.matrix()[0]
+        tabelle = pd.DataFrame({'IKZ': betraege.index}, index=betraege.index)
+        for p in betraege.columns:
+            tabelle[p.replace('Projektart', 'PA')] = euro_format(betraege_in_euro(betraege[p]), einheit='', na='-')
+        return tabelle.reset_index(drop=True)
+
+    # Alle Zellen inkl. Summen zeilenweise (IKZ, Projektart, Kontostand in Cent, Kategorie), z.B. für die CSV-Ausgabe
+    def tabelle_lang(self):
+        betraege, kategorien = self.matrix()
+        zeilen = [(ikz, p, betraege.at[ikz, p], kategorien.at[ikz, p])
+                  for ikz in betraege.index for p in betraege.columns if pd.notna(betraege.at[ikz, p])]
+        lang = pd.DataFrame(zeilen, columns=['IKZ', 'Projektart', 'Kontostand', 'Kategorie'])
+        return lang.astype({'Kontostand': 'Int64'})
+
+    # Übersicht in TXT- und PDF-Bericht schreiben (im PDF mit eingefärbten Beträgen)
+    def schreiben(self, title, txt=None, pdf=None):
+        tabelle = self.tabelle()
+        kategorien = self.matrix()[1]
+
+        if txt:
+            txt.append_title(title)
+            txt.append_tabelle(tabelle)
+            txt.append("\n\n")
+
+        if pdf:
+            from reportlab.lib.units import cm
+            from reportlab.platypus import Paragraph, Table, TableStyle
+
+            tab = Table([tabelle.columns.tolist()] + tabelle.values.tolist(), repeatRows=1)
+            tab.setStyle(pdf.rwth_tab_style)
+            tab.setStyle(TableStyle([('FONTSIZE', (0, 0), (-1, -1), 7),
+                                     ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),  # Summenzeile
+                                     ('ALIGN', (0, 1), (0, -1), 'LEFT')]))
+            farben = []
+            for spalte, p in enumerate(kategorien.columns, start=1):
+                farben += PDFReport.zusammenfassungstabelle_farbe(kategorien[p].tolist(), spalte)
+            tab.setStyle(TableStyle(farben))
+            tab.spaceBefore = 0.5 * cm
+            pdf.append(Paragraph(title, pdf.styles['Heading2']))
+            pdf.append(tab)
+
+
 class PABericht:
-    def __init__(self, txt=None, pdf=None, tmp=None):
+    def __init__(self, txt=None, pdf=None, plots=True, backend='matplotlib', diagramm_cache=None, summieren=False,
+                 pool=None):
         self.txt = txt
         self.pdf = pdf
-        self.tmp = tmp
-        self.summary = pd.DataFrame(columns=['Projektart', 'Bemerkung', 'Kontostand'])
+        self.plots = plots
+        self.backend = backend
+        self.diagramm_cache = diagramm_cache  # optionaler DiagrammCache
+        self.summieren = summieren  # Zusammenfassung auch ohne TXT- und PDF-Bericht (z.B. für die Fakultätsübersicht)
+        self.pool = pool  # optionaler, bereits laufender Prozesspool für die Diagramme (z.B. im Überwachungsmodus)
+        self.summary = Zusammenfassung()
+
+    # Alle Zahlenspalten eines Tabellenblocks als Geldbeträge formatieren (Cent werden in Euro umgerechnet, die Daten
+    # des Aufrufers bleiben unverändert)
+    @staticmethod
+    def betraege_formatieren(df):
+        df = df.copy()
+        for col in df.select_dtypes(include=['number']):
+            df[col] = euro_format(betraege_in_euro(df[col]))
+        return df
 
     # Funktion zum Erzeugen einer Suchmaske basieren auf der Projektart
     @staticmethod
     def pa_pattern(pa):
         return fr'^\d{{3}}{pa}\d{{10}}$'
 
-    # Schreiben der Projektarten oder PSP-Elemente in die Berichte
-    def pa_auflistung(self, df, pattern, title, sum_up=True):
+    # Jahressummen für einen Sub-Bericht ermitteln (mit aggregiert=True sind die Daten bereits die Jahressummen, z.B.
+    # aus PAWuerfel.auswahl, und werden nicht mehr gefiltert und gruppiert)
+    @staticmethod
+    def pa_daten(df, pattern, aggregiert=False):
+        if aggregiert:
+            return df
+
         # Datensatz nach gewünschter PA filtern
         if pattern:
             df = cont(df, 'PSP', pattern)
 
         # Gruppierung nur für das Jahr erzeugen
-        gdf = df.groupby('Jahr').sum(numeric_only=True).reset_index()
-
+        return df.groupby('Jahr').sum(numeric_only=True).reset_index()
+
+    # Schreiben der Projektarten oder PSP-Elemente in die Berichte (laufend: der Sub-Bericht umfasst nur laufende
+    # Projekte, ein negativer Kontostand wird in der Zusammenfassung dann orange statt rot markiert)
+    def pa_auflistung(self, df, pattern, title, sum_up=True, aggregiert=False, laufend=False):
+        # ohne TXT- und PDF-Bericht werden die Sub-Berichte nur für die Zusammenfassung benötigt
+        if not (self.txt or self.pdf or self.summieren):
+            return
+
+        gdf = self.pa_daten(df, pattern, aggregiert)
+
+        # Plot für PDF Bericht vorbereiten (wenn Diagramme gewünscht sind und nicht im Cache liegen)
+        plot = None
+        if self.pdf and self.plots:
+            plot = self.diagramm_cache.holen(gdf, title) if self.diagramm_cache else None
+            if plot is None:
+                plot = plot_pa(gdf[['Jahr', 'Kontostand']], title, self.backend)
+
+        self.pa_ausgabe(gdf, title, sum_up, plot, laufend)
+        return gdf
+
+    # Sub-Berichte parallel erzeugen: die Jahressummen werden in Threads ermittelt, die Diagramme in einem Prozesspool
+    # gezeichnet. Das Einfügen in Zusammenfassung, TXT- und PDF-Bericht erfolgt danach in der ursprünglichen
+    # Reihenfolge, sodass der Bericht unabhängig von der Parallelisierung gleich bleibt.
+    def pa_auflistung_parallel(self, pa_rel, prozesse=0):
+        # ohne TXT- und PDF-Bericht werden die Sub-Berichte nur für die Zusammenfassung benötigt
+        if not (self.txt or self.pdf or self.summieren):
+            return
+
+        prozesse = prozesse or os.cpu_count() or 1
+        if prozesse == 1:
+            for pa in pa_rel:
+                with LogContext(f"Erzeugung Sub-Bericht {pa[2]}", len(pa[0])) as log:
+                    log.zeilen(aus=len(self.pa_auflistung(*pa)))
+            return
+
+        # Prozesspool nur für matplotlib Diagramme; reportlab Diagramme werden direkt in den Threads erzeugt. Ein
+        # übergebener Pool wird genutzt und bleibt nach den Sub-Berichten bestehen.
+        mit_pool = self.pdf and self.plots and self.backend == 'matplotlib'
+        if not mit_pool:
+            diagramm_pool = ThreadPoolExecutor(max_workers=1)
+        elif self.pool:
+            diagramm_pool = nullcontext(self.pool)
+        else:
+            diagramm_pool = ProcessPoolExecutor(max_workers=prozesse)
+        with ThreadPoolExecutor(max_workers=prozesse) as threads, diagramm_pool as pool:
+            def vorbereiten(df, pattern, title, sum_up=True, aggregiert=False, laufend=False):
+                gdf = self.pa_daten(df, pattern, aggregiert)
+                plot = None
+                if self.pdf and self.plots and len(gdf):
+                    plot = self.diagramm_cache.holen(gdf, title) if self.diagramm_cache else None
+                    if plot is None and mit_pool:
+                        plot = pool.submit(plot_pa, gdf[['Jahr', 'Kontostand']], title, self.backend)
+                    elif plot is None:
+                        plot = plot_pa(gdf[['Jahr', 'Kontostand']], title, self.backend)
+                return gdf, plot
+
+            auftraege = [threads.submit(vorbereiten, *pa) for pa in pa_rel]
+
+            for pa, auftrag in zip(pa_rel, auftraege):
+                with LogContext(f"Erzeugung Sub-Bericht {pa[2]}", len(pa[0])) as log:
+                    gdf, plot = auftrag.result()
+                    log.zeilen(aus=len(gdf))
+                    if isinstance(plot, Future):
+                        plot = plot.result()
+                    self.pa_ausgabe(gdf, pa[2], pa[3] if len(pa) > 3 else True, plot, len(pa) > 5 and pa[5])
+
+    # Ergebnisse eines Sub-Berichtes in Zusammenfassung, TXT- und PDF-Bericht schreiben (plot: Diagramm als SVG-Daten
+    # oder als reportlab Drawing, siehe plot_pa, bzw. aus dem DiagrammCache)
+    def pa_ausgabe(self, gdf, title, sum_up=True, plot=None, laufend=False):
         # wenn was übrig ist, dann alles Schreiben und Daten für Zusammenfassung berechnen
         if len(gdf):
-            dc = dict()
-            tit = title.split('|')
-            dc['Projektart'] = tit[0]
-            if len(tit) > 1:
-                dc['Bemerkung'] = tit[1]
-            else:
-                dc['Bemerkung'] = ''
-            dc['Kontostand'] = round(gdf.iloc[-1]['Kontostand'], 2)
+            # SVG-Daten einmal in ein reportlab Drawing umwandeln, das so (unskaliert) im Cache abgelegt wird
+            if isinstance(plot, bytes):
+                from svglib.svglib import svg2rlg
+                plot = svg2rlg(io.BytesIO(plot))
+            if self.diagramm_cache and plot is not None:
+                self.diagramm_cache.ablegen(gdf, title, plot)
 
             # Ergebnis für Zusammenfassung in Instanz zwischenspeichern
             if sum_up:
-                self.summary.loc[len(self.summary)] = dc
+                tit = title.split('|')
+                self.summary.hinzufuegen(tit[0], tit[1] if len(tit) > 1 else '', int(gdf['Kontostand'].iloc[-1]),
+                                         laufend)
 
             # Ergebnisse im Detail schreiben
             if self.txt:
                 self.txt.append_title(title)
-                cdf = gdf.copy(deep=True)
-                for col in cdf.select_dtypes(include=['number']):
-                    cdf[col] = cdf[col].apply(lambda x: locale.format_string('%.2f €', x, grouping=True))
-                self.txt.append(cdf.to_string(index=False, float_format=lambda x: f'{x:.2f}') + "\n\n")
+                self.txt.append_tabelle(gdf, self.betraege_formatieren)
+                self.txt.append("\n\n")
 
             if self.pdf:
+                from reportlab.lib.pagesizes import A4
+                from reportlab.platypus import Paragraph, KeepTogether
+
                 p_tit = Paragraph(title, self.pdf.styles['Heading3'])
 
                 img = Paragraph("")  # leeren Abschnitt als Bildersatz nutzen.
 
-                # Plot für PDF Bericht vorbereiten (wenn ein temporäres Verzeichnis gegeben wurde)
-                if self.tmp:
-                    fn = self.tmp.temp_dir + f"/{urllib.parse.quote(pattern, safe='')}.svg"
-                    if not plot_pa(gdf[['Jahr', 'Kontostand']], fn, title):
-                        return False
-
-                    # Plot in PDF integrieren
+                # Plot direkt aus dem Speicher in PDF integrieren (wenn ein Diagramm erzeugt wurde)
+                if plot is not None:
                     page_width, page_height = A4
                     image_width = page_width * 0.85
-                    matplotlib.use('svg')  # Stellt sicher, dass das SVG-Backend verwendet wird
-                    img = svg2rlg(fn)
+                    img = plot
                     scale_factor = image_width / img.width
                     img.width = image_width
                     img.height *= scale_factor
@@ -720,32 +2001,32 @@ class PABericht:
         if self.txt:
             self.txt.append(f"\n")
             self.txt.append_title(title)
-            for col in df.select_dtypes(include=['number']):
-                df[col] = df[col].apply(lambda x: locale.format_string('%.2f €', x, grouping=True
-                                                                       ) if not pd.isna(x) else 'k.A.')
-            self.txt.append(df.to_string(index=False, float_format=lambda x: f'{x:.2f}') + "\n\n")
+            self.txt.append_tabelle(df, self.betraege_formatieren)
+            self.txt.append("\n\n")
 
     # Schreiben der Zusammenfassung
     def zusammenfassung(self, title):
-        # Summe der Zusammenfassung berechnen
-        sums = self.summary.sum(numeric_only=True)
-        sums[self.summary.columns[0]] = 'Summe'
-        sums[self.summary.columns[1]] = ''
-        summary = pd.concat([self.summary, sums.to_frame().T], ignore_index=True)
-        summary['Kontostand'] = summary['Kontostand'].apply(
-            lambda x: locale.format_string('%.2f €', x, grouping=True))
+        # ohne TXT- und PDF-Bericht wird die Zusammenfassung nicht benötigt
+        if not (self.txt or self.pdf):
+            return
+
+        # Tabelle inkl. Summe erst hier formatieren
+        summary = self.summary.tabelle()
 
         if self.txt:
             self.txt.append(f"\n")
             self.txt.append_title(title)
-            self.txt.append(summary.to_string(index=False))
+            self.txt.append_tabelle(summary)
             self.txt.append("\n\n")
 
         if self.pdf:
+            from reportlab.lib.units import cm
+            from reportlab.platypus import Paragraph, Table, KeepTogether, PageBreak, TableStyle
+
             table_data = [summary.columns.tolist()] + summary.values.tolist()
             tab = Table(table_data)
             tab.setStyle(self.pdf.rwth_tab_style)
-            number_styles = PDFReport.zusammenfassungstabelle_farbe(table_data)
+            number_styles = PDFReport.zusammenfassungstabelle_farbe(self.summary.kategorien())
             tab.setStyle(TableStyle(number_styles))
             tab.spaceBefore = 1 * cm
             tab.spaceAfter = 1.5 * cm
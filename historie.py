@@ -0,0 +1,161 @@
+import argparse
+import os
+import re
+import sqlite3
+from datetime import datetime
+import pandas as pd
+from funktionen import betragsspalten, betraege_in_euro, euro_format, kompakt
+from version import program_version
+
+# Historie der Auswertungen in einer lokalen SQLite Datenbank. Jeder Lauf legt die importierten Zeilen (je PSP-Element
+# und Jahr, Beträge in Cent) zusammen mit dem Stand der SAP Berichte ab. Damit lassen sich Kontostände verschiedener
+# Berichtsstände vergleichen, ohne alte Berichte oder CSV-Dateien erneut einlesen zu müssen. Wird derselbe SAP Stand
+# für eine IKZ erneut ausgewertet, ersetzt er den vorherigen Eintrag.
+
+schema = """
+CREATE TABLE IF NOT EXISTS laeufe (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ikz TEXT NOT NULL,
+    stand TEXT NOT NULL,
+    berichtsdaten TEXT NOT NULL,
+    erstellt TEXT NOT NULL,
+    version TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS laeufe_ikz ON laeufe (ikz, stand);
+CREATE TABLE IF NOT EXISTS werte (
+    lauf INTEGER NOT NULL REFERENCES laeufe (id) ON DELETE CASCADE,
+    ikz TEXT NOT NULL,
+    pa TEXT,
+    psp TEXT NOT NULL,
+    psp_name TEXT,
+    status TEXT,
+    geldgeber TEXT,
+    projektende TEXT,
+    jahr INTEGER NOT NULL,
+""" + ",\n".join(f'    "{s}" INTEGER' for s in betragsspalten) + """
+);
+CREATE INDEX IF NOT EXISTS werte_ikz ON werte (ikz, pa, psp, jahr);
+CREATE INDEX IF NOT EXISTS werte_psp ON werte (psp, jahr);
+CREATE INDEX IF NOT EXISTS werte_lauf ON werte (lauf);
+"""
+
+
+# Stand der SAP Berichte (jüngstes Erstelldatum aus den Berichtsinformationen, siehe check_sap_header) als ISO-Datum;
+# ohne Angaben (z.B. bei abgeschalteter Prüfung) das aktuelle Datum
+def berichtsstand(rep_dates):
+    daten = [datetime.strptime(d, '%d.%m.%Y') for d in re.findall(r'\d{2}\.\d{2}\.\d{4}', rep_dates or '')]
+    return max(daten).strftime('%Y-%m-%d') if daten else datetime.now().strftime('%Y-%m-%d')
+
+
+class Historie:
+    def __init__(self, pfad):
+        self.pfad = pfad
+        if os.path.dirname(pfad):
+            os.makedirs(os.path.dirname(pfad), exist_ok=True)
+        with self.verbinden() as con:
+            con.executescript(schema)
+
+    def verbinden(self):
+        con = sqlite3.connect(self.pfad, timeout=30)
+        con.execute("PRAGMA foreign_keys = ON")
+        return con
+
+    # Importierten Datensatz (eine oder mehrere IKZ, siehe import_sap_csv) mit den Berichtsinformationen ablegen.
+    # Rückgabe: Dictionary IKZ -> Nummer des Laufs
+    def speichern(self, df, rep_dates):
+        df = kompakt(df)
+        stand = berichtsstand(rep_dates)
+        erstellt = datetime.now().isoformat(timespec='seconds')
+        werte = pd.DataFrame({
+            'ikz': df['PSP'].astype(str).str[5:11],
+            'pa': df['PA'].astype(object),
+            'psp': df['PSP'].astype(str),
+            'psp_name': df['PSPName'].astype(object),
+            'status': df['Status'].astype(object),
+            'geldgeber': df['Geldgeber'].astype(object),
+            'projektende': df['Projektende'].dt.strftime('%Y-%m-%d'),
+            'jahr': df['Jahr'].astype(int),
+        })
+        for s in betragsspalten:
+            werte[s] = df[s].astype(object).where(df[s].notna(), None)
+
+        laeufe = dict()
+        con = self.verbinden()
+        try:
+            with con:
+                for ikz, teil in werte.groupby('ikz', sort=True):
+                    # gleicher SAP Stand für die IKZ ersetzt den vorherigen Lauf
+                    con.execute("DELETE FROM laeufe WHERE ikz = ? AND berichtsdaten = ? AND berichtsdaten != ''",
+                                (ikz, rep_dates or ''))
+                    lauf = con.execute("INSERT INTO laeufe (ikz, stand, berichtsdaten, erstellt, version) "
+                                       "VALUES (?, ?, ?, ?, ?)",
+                                       (ikz, stand, rep_dates or '', erstellt, program_version)).lastrowid
+                    teil.insert(0, 'lauf', lauf)
+                    teil.to_sql('werte', con, if_exists='append', index=False)
+                    laeufe[ikz] = lauf
+        finally:
+            con.close()
+        return laeufe
+
+    # Alle abgelegten Läufe (optional für eine IKZ), nach Stand sortiert
+    def laeufe(self, ikz=None):
+        sql = "SELECT id, ikz, stand, erstellt, version, berichtsdaten FROM laeufe"
+        sql += " WHERE ikz = ? ORDER BY stand, id" if ikz else " ORDER BY ikz, stand, id"
+        with self.verbinden() as con:
+            return pd.read_sql_query(sql, con, params=(ikz,) if ikz else None)
+
+    # Filter für IKZ, Projektart, PSP-Element und Jahr als SQL-Bedingung mit Parametern
+    @staticmethod
+    def bedingung(ikz=None, pa=None, psp=None, jahr=None):
+        kriterien = [(f, w) for f, w in [('w.ikz', ikz), ('w.pa', pa), ('w.psp', psp), ('w.jahr', jahr)]
+                     if w is not None]
+        sql = " WHERE " + " AND ".join(f"{f} = ?" for f, _ in kriterien) if kriterien else ""
+        return sql, [str(w) if f != 'w.jahr' else int(w) for f, w in kriterien]
+
+    # Abgelegte Zeilen eines Laufs bzw. aller Läufe (Beträge in Cent wie nach dem Import)
+    def werte(self, lauf=None, ikz=None, pa=None, psp=None, jahr=None):
+        sql, parameter = self.bedingung(ikz, pa, psp, jahr)
+        if lauf is not None:
+            sql += (" AND" if sql else " WHERE") + " w.lauf = ?"
+            parameter.append(int(lauf))
+        with self.verbinden() as con:
+            df = pd.read_sql_query(f"SELECT l.stand, w.* FROM werte w JOIN laeufe l ON l.id = w.lauf{sql} "
+                                   f"ORDER BY l.stand, w.lauf, w.psp, w.jahr", con, params=parameter)
+        return df.astype({s: 'Int64' for s in betragsspalten})
+
+    # Verlauf eines Betrags (Standard: Kontostand) über die Berichtsstände: Summe über die ausgewählten PSP-Elemente je
+    # Stand (Zeilen) und Jahr (Spalten) in Euro. Mehrere Läufe zum selben Stand werden getrennt ausgewiesen.
+    def verlauf(self, ikz=None, pa=None, psp=None, jahr=None, spalte='Kontostand'):
+        if spalte not in betragsspalten:
+            raise ValueError(f"Unbekannte Spalte '{spalte}'. Erlaubt sind: {', '.join(betragsspalten)}")
+        sql, parameter = self.bedingung(ikz, pa, psp, jahr)
+        with self.verbinden() as con:
+            df = pd.read_sql_query(f'SELECT l.stand, w.lauf, w.jahr, SUM(w."{spalte}") AS betrag '
+                                   f'FROM werte w JOIN laeufe l ON l.id = w.lauf{sql} '
+                                   f'GROUP BY w.lauf, w.jahr ORDER BY l.stand, w.lauf, w.jahr', con, params=parameter)
+        df['betrag'] = betraege_in_euro(df['betrag'].astype('Int64'))
+        tabelle = df.pivot(index=['stand', 'lauf'], columns='jahr', values='betrag')
+        tabelle.columns.name = None
+        return tabelle
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verlauf der Kontostände aus der LSControlling Historie anzeigen")
+    parser.add_argument('datenbank', nargs='?', default='historie.sqlite',
+                        help="Pfad zur Datenbank (Standard: historie.sqlite)")
+    parser.add_argument('--ikz', help="nur diese IKZ")
+    parser.add_argument('--pa', help="nur diese Projektart (z.B. 68)")
+    parser.add_argument('--psp', help="nur dieses PSP-Element")
+    parser.add_argument('--jahr', type=int, help="nur dieses Jahr")
+    parser.add_argument('--spalte', default='Kontostand', help="Betragsspalte (Standard: Kontostand)")
+    parser.add_argument('--laeufe', action='store_true', help="nur die abgelegten Läufe auflisten")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.datenbank):
+        parser.error(f"Die Datenbank {args.datenbank} existiert nicht.")
+    historie = Historie(args.datenbank)
+    if args.laeufe:
+        print(historie.laeufe(args.ikz).drop(columns='berichtsdaten').to_string(index=False))
+    else:
+        tabelle = historie.verlauf(args.ikz, args.pa, args.psp, args.jahr, args.spalte)
+        print(tabelle.apply(euro_format).to_string() if len(tabelle) else "Keine Einträge gefunden.")
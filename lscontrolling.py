@@ -1,96 +1,373 @@
+import argparse
+import copy
+import io
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import nullcontext, redirect_stdout
 from datetime import datetime, timedelta
-from funktionen import PABericht, RandomTemp, TXTReport, PDFReport, agg_proj, write_csv, import_sap_csv, \
-    import_detail_plot, laufende_projekte_ignorieren, nur_sammelkonten, keine_sammelkonten, \
-    nur_laufende_projekte, LSControllingConfig, LogContext
+from multiprocessing import freeze_support
+from funktionen import PABericht, TXTReport, PDFReport, agg_proj, write_csv, import_sap_csv_cached, \
+    import_detail_plot, PAWuerfel, LSControllingConfig, LogContext, ikz_aufteilen, ausgabeformate, DiagrammCache, \
+    Fakultaetsuebersicht, SAPExportFehler, DatensatzFehler, KonfigurationsFehler
 
-if __name__ == "__main__":
-    try:
-        # --- Datenimport und Preprocessing ----------------------------------------------------------------------------
 
-        # Prüfen, ob eine Config Datei gegeben wurde; wenn ja, dann Werte aus Config nutzen, ansonsten Default Werte
-        cfg = LSControllingConfig('config.ini')
+# Dateinamen der Ausgaben für eine IKZ (Format -> Dateiname)
+def ausgabedateien(ikz):
+    return {'txt': f"{ikz}_Bericht.txt", 'pdf': f"{ikz}_Bericht.pdf", 'csv': f"{ikz}_Projektansicht.csv"}
 
-        # Daten aus SAP importieren
-        with LogContext("Datenimport und -bereinigung"):
-            ikz, df_ikz, rep_dates = import_sap_csv(cfg)
 
-        # Jahresspanne der Daten ermitteln
-        min_jahr = df_ikz['Jahr'].min()
-        max_jahr = df_ikz['Jahr'].max()
+# Berichte (TXT, PDF und CSV, je nach Config-Schlüssel 'ausgabe') für eine IKZ im angegebenen Verzeichnis erzeugen
+# (prozesse: Anzahl der Prozesse für die Sub-Berichte, ohne Angabe aus der Config, 1 schreibt auch die Ausgaben
+# nacheinander; summieren: Zusammenfassung auch ohne TXT- und PDF-Bericht ermitteln; pool: bereits laufender
+# Prozesspool für die Diagramme und den PDF-Bericht; ziele: Dictionary Format -> Dateipfad oder Puffer, das die
+# Dateien im Verzeichnis ersetzt; detailplot: Detailplot-Datei oder -Puffer, ohne Angabe aus der Config). Rückgabe:
+# Zusammenfassung der Sub-Berichte (None, wenn nicht ermittelt)
+def berichte_erzeugen(cfg, ikz, df_ikz, rep_dates, verzeichnis='.', prozesse=None, summieren=False, pool=None,
+                      ziele=None, detailplot=None):
+    ausgabe = ausgabeformate(cfg['ausgabe'])
+    # Anzahl der Prozesse einmal auflösen (0 = alle Prozessorkerne), damit auf Rechnern mit einem Kern auch die
+    # Ausgaben nacheinander geschrieben werden
+    prozesse = (cfg['parallel_prozesse'] if prozesse is None else prozesse) or os.cpu_count() or 1
+    ziele = {**{f: os.path.join(verzeichnis, name) for f, name in ausgabedateien(ikz).items()}, **(ziele or dict())}
+
+    # Jahresspanne der Daten ermitteln
+    min_jahr = df_ikz['Jahr'].min()
+    max_jahr = df_ikz['Jahr'].max()
 
-        # --- Datenfilter anwenden -------------------------------------------------------------------------------------
+    txt = None
+    pdf = None
+    bericht = None
+    if 'txt' in ausgabe or 'pdf' in ausgabe or summieren:
+        # --- Datenaggregation nach Projektart, Kontoart und Laufzeit -------------------------------------------------
 
-        with LogContext("Datenfilterung"):
+        with LogContext("Datenaggregation", len(df_ikz)) as log:
             cut1 = datetime(int(max_jahr), 6, 30)  # 30. Juni des letzten Jahres als Cutoff nutzen
             cut2 = cut1 + timedelta(days=1)
-            df_ikz_sk = nur_sammelkonten(df_ikz)  # nur Sammelkonten
-            df_ikz_ek_alle = keine_sammelkonten(df_ikz)  # alle Einzelkonten aber keine Sammelkonten
-            df_ikz_ek_abgelaufen = laufende_projekte_ignorieren(df_ikz_ek_alle, cut1)  # abgelaufene E.konten vor cutoff
-            df_ikz_ek_laufend = nur_laufende_projekte(df_ikz_ek_alle, cut1)  # nur laufende E.konten nach cutoff
+            wuerfel = PAWuerfel(df_ikz, cut1)  # Jahressummen nach PA, Sammel-/Einzelkonten und Laufzeit vor/nach Cutoff
+            log.zeilen(aus=sum(len(w) for w in wuerfel.wuerfel.values()))
 
         # --- Datenauswertung ------------------------------------------------------------------------------------------
 
-        # zufälliges temporäres Verzeichnis erzeugen
-        tmp = RandomTemp()
-
         with LogContext(f"Berichtsinstanzen für IKZ {ikz} erzeugen"):
+            titel = f"Finanzübersicht {min_jahr} - {max_jahr} für die IKZ {ikz}"
+            untertitel = "Kontostände nach Projektart und Jahr in Euro"
+
             # Text-Bericht Instanz erzeugen
-            txt = TXTReport(f"{ikz}_Bericht.txt")
-            txt.append_title(f"Finanzübersicht {min_jahr} - {max_jahr} für die IKZ {ikz}")
+            if 'txt' in ausgabe:
+                txt = TXTReport(ziele['txt'])
+                txt.append_title(titel)
+                txt.append(untertitel + "\n\n")
 
             # PDF-Bericht Instanz erzeugen
-            pdf = PDFReport(f"{ikz}_Bericht.pdf", ikz)
-            pdf.append_title(f"Finanzübersicht {min_jahr} - {max_jahr} für die IKZ {ikz}")
-
-            # Instanz für Berichtsinhalt erzeugen
-            bericht = PABericht(txt=txt, pdf=pdf, tmp=tmp)
+            if 'pdf' in ausgabe:
+                pdf = PDFReport(ziele['pdf'], ikz)
+                pdf.append_title(titel)
+                pdf.append_title2(untertitel)
 
-            # Ermitteln der einzelnen Sub-Positionen für den Bericht und Schreiben der Ergebnisse in eine Datei
-            txt.append("Kontostände nach Projektart und Jahr in Euro\n\n")
-            pdf.append_title2("Kontostände nach Projektart und Jahr in Euro")
+            # Instanz für Berichtsinhalt erzeugen (Diagramme ggf. aus dem Cache)
+            diagramm_cache = DiagrammCache(cfg) if cfg['diagramm_cache'] and pdf else None
+            bericht = PABericht(txt=txt, pdf=pdf, backend=cfg['diagramm_backend'], diagramm_cache=diagramm_cache,
+                                summieren=summieren, pool=pool)
 
         with LogContext("Festlegen der relevanten Projektarten"):
             # Definieren der relevanten Projektarten für den Bericht
             pa_rel = []
             for pa in cfg['liste_pa_aufteilung']:
-                pa_rel.append([df_ikz_sk, bericht.pa_pattern(pa),
-                               f"Projektart {pa} | Sammelkonten (alle)", True])
-                pa_rel.append([df_ikz_ek_abgelaufen, bericht.pa_pattern(pa),
-                               f"Projektart {pa} | Einzelkonten (Projektende vor {cut1.strftime('%d.%m.%y')})", True])
-                pa_rel.append([df_ikz_ek_laufend, bericht.pa_pattern(pa),
-                               f"Projektart {pa} | Einzelkonten (Projektende nach {cut2.strftime('%d.%m.%y')})", True])
+                pa_rel.append([wuerfel.auswahl(pa, 'Sammelkonto'), bericht.pa_pattern(pa),
+                               f"Projektart {pa} | Sammelkonten (alle)", True, True])
+                pa_rel.append([wuerfel.auswahl(pa, 'Einzelkonto', 'abgelaufen'), bericht.pa_pattern(pa),
+                               f"Projektart {pa} | Einzelkonten (Projektende vor {cut1.strftime('%d.%m.%y')})", True,
+                               True])
+                pa_rel.append([wuerfel.auswahl(pa, 'Einzelkonto', 'laufend'), bericht.pa_pattern(pa),
+                               f"Projektart {pa} | Einzelkonten (Projektende nach {cut2.strftime('%d.%m.%y')})", True,
+                               True, True])  # laufende Projekte: negativer Kontostand nur orange markieren
             for pa in cfg['liste_pa_keine_aufteilung']:
-                pa_rel.append([df_ikz, bericht.pa_pattern(pa), f"Projektart {pa} | Alle Konten", True])
+                pa_rel.append([wuerfel.auswahl(pa), bericht.pa_pattern(pa), f"Projektart {pa} | Alle Konten", True,
+                               True])
 
-            # Prüfen, ob ein Detailplot integriert werden soll, wenn ja, pa_rel erweitern
-            import_detail_plot(df_ikz, cfg['csv_detailplot'], pa_rel)
+            # Prüfen, ob ein Detailplot integriert werden soll, wenn ja, pa_rel erweitern (im Batch-Modus nur
+            # PSP-Elemente der eigenen IKZ)
+            import_detail_plot(df_ikz, cfg['csv_detailplot'] if detailplot is None else detailplot, pa_rel,
+                               ikz if cfg['batch_modus'] else None)
 
-        # Erzeugen der Berichtsdaten für die relevanten Projektarten und Projekte
-        for pa in pa_rel:
-            with LogContext(f"Erzeugung Sub-Bericht {pa[2]}"):
-                bericht.pa_auflistung(*pa)
+        # Erzeugen der Berichtsdaten für die relevanten Projektarten und Projekte (parallel, gleiche Reihenfolge)
+        with LogContext("Erzeugung der Sub-Berichte", len(df_ikz)):
+            bericht.pa_auflistung_parallel(pa_rel, prozesse)
+        if diagramm_cache:
+            diagramm_cache.aufraeumen()
 
         # Zusammenfassung schreiben
         with LogContext(f"Erzeugung der Zusammenfassung für IKZ {ikz}"):
             bericht.zusammenfassung(f"Zusammenfassung für IKZ {ikz} (Stand 31.12.{max_jahr})")
 
-        # Details nach Projekt in CSV und Textbericht schreiben
-        with LogContext("Erzeugung der Projektdetailansichten"):
+    # Details nach Projekt für CSV und Textbericht aggregieren
+    ap = None
+    if 'csv' in ausgabe or txt:
+        with LogContext("Erzeugung der Projektdetailansichten", len(df_ikz)) as log:
             ap = agg_proj(df_ikz)
-            write_csv(ap, ikz + '_Projektansicht.csv')
-            bericht.detail(ap, f"Details nach Projekt für IKZ {ikz} (Stand 31.12.{max_jahr})")
+            log.zeilen(aus=len(ap))
+
+    # Ausgaben gleichzeitig schreiben: Layout des PDF-Berichtes in einem eigenen Prozess, TXT und CSV in Threads (ein
+    # PDF in einen Puffer muss im aktuellen Prozess entstehen und läuft dann ebenfalls in einem Thread)
+    auftraege = dict()
+    prozess_auftraege = dict()
+    if 'csv' in ausgabe:
+        auftraege['CSV'] = lambda: write_csv(ap, ziele['csv'])
+    if txt:
+        def txt_schreiben():
+            try:
+                bericht.detail(ap, f"Details nach Projekt für IKZ {ikz} (Stand 31.12.{max_jahr})")
+                txt.signature_lines(ikz)
+                txt.berichts_info(rep_dates)
+                txt.finalize()
+            except Exception:
+                txt.verwerfen()
+                raise
+        auftraege['TXT'] = txt_schreiben
+    if pdf:
+        pdf.signature_lines(ikz)
+        pdf.berichts_info(rep_dates)
+        (prozess_auftraege if isinstance(ziele['pdf'], (str, os.PathLike)) else auftraege)['PDF'] = pdf.finalize
 
-        # Berichtsdateien finalisieren schließen
+    if auftraege or prozess_auftraege:
         with LogContext("Finalisieren des Berichtes"):
-            txt.signature_lines(ikz)
-            txt.berichts_info(rep_dates)
-            txt.finalize()
-            pdf.signature_lines(ikz)
-            pdf.berichts_info(rep_dates)
-            pdf.finalize()
-
-            # Temporäres Verzeichnis löschen
-            tmp.delete_temp_dir()
+            ausgaben_schreiben(auftraege, prozess_auftraege, pool, parallel=prozesse > 1)
+
+    return bericht.summary if bericht else None
+
+
+# Ausgaben gleichzeitig schreiben: auftraege (Name -> Funktion) laufen in Threads, prozess_auftraege in einem eigenen
+# Prozess bzw. im übergebenen Prozesspool (z.B. das Layout des PDF-Berichtes, das sonst durch den GIL die Threads
+# ausbremst). Mit parallel=False wird alles nacheinander im aktuellen Prozess geschrieben. Es werden immer alle Ausgaben
+# versucht; schlägt eine fehl, wird danach ihr Fehler ausgelöst (bei mehreren eine Exception mit allen Fehlern).
+def ausgaben_schreiben(auftraege, prozess_auftraege=None, pool=None, parallel=True):
+    prozess_auftraege = prozess_auftraege or dict()
+    fehler = dict()
+    if not parallel or len(auftraege) + len(prozess_auftraege) < 2:
+        for name, funktion in {**auftraege, **prozess_auftraege}.items():
+            try:
+                funktion()
+            except Exception as e:
+                fehler[name] = e
+    else:
+        prozess_pool = nullcontext(pool) if pool or not prozess_auftraege else ProcessPoolExecutor(max_workers=1)
+        with ThreadPoolExecutor(max_workers=max(len(auftraege), 1)) as threads, prozess_pool as prozess:
+            futures = {name: prozess.submit(funktion) for name, funktion in prozess_auftraege.items()}
+            futures.update({name: threads.submit(funktion) for name, funktion in auftraege.items()})
+            for name, future in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    fehler[name] = e
+
+    if len(fehler) == 1:
+        raise next(iter(fehler.values()))
+    if fehler:
+        raise Exception("Fehler beim Schreiben der Ausgaben: " +
+                        "; ".join(f"{name}: {e}" for name, e in fehler.items()))
+
+
+# Berichte für eine IKZ in einem Batch-Prozess erzeugen (ohne Ausgabe der einzelnen Schritte auf der Konsole). Die
+# Sub-Berichte laufen hier sequentiell, da die Prozessorkerne bereits durch die IKZ ausgelastet sind. Rückgabe: die
+# Zusammenfassung der IKZ für die Fakultätsübersicht
+def batch_ikz(cfg, ikz, df_ikz, rep_dates):
+    LogContext.aktiv = False
+    verzeichnis = os.path.join(cfg['batch_verzeichnis'], ikz)
+    os.makedirs(verzeichnis, exist_ok=True)
+    LogContext.konfigurieren(cfg, os.path.join(verzeichnis, 'Profil.prof'))
+    zusammenfassung = berichte_erzeugen(cfg, ikz, df_ikz, rep_dates, verzeichnis, prozesse=1,
+                                        summieren=cfg['fakultaetsbericht'])
+    if cfg['messbericht']:
+        LogContext.messbericht_schreiben(os.path.join(verzeichnis, f"{ikz}_Messung.{cfg['messbericht']}"))
+    return zusammenfassung
+
+
+# Fakultätsübersicht (Kontostände je IKZ und Projektart) aus den Zusammenfassungen der IKZ im batch_verzeichnis
+# erzeugen: TXT und PDF je nach Config-Schlüssel 'ausgabe', die CSV-Datei immer
+def fakultaetsbericht_erzeugen(cfg, zusammenfassungen, max_jahr, rep_dates, fehler=None):
+    ausgabe = ausgabeformate(cfg['ausgabe'])
+    verzeichnis = cfg['batch_verzeichnis']
+    uebersicht = Fakultaetsuebersicht(zusammenfassungen)
+    titel = f"Fakultätsübersicht für {len(zusammenfassungen)} IKZ (Stand 31.12.{max_jahr})"
+    untertitel = "Kontostände nach IKZ und Projektart in Euro"
+    hinweis = f"Ohne die fehlerhaften IKZ {', '.join(sorted(fehler))}" if fehler else ""
+
+    write_csv(uebersicht.tabelle_lang(), os.path.join(verzeichnis, "Fakultaet_Uebersicht.csv"))
+
+    if 'txt' in ausgabe:
+        txt = TXTReport(os.path.join(verzeichnis, "Fakultaet_Uebersicht.txt"))
+        txt.append(untertitel + (f"\n{hinweis}" if hinweis else "") + "\n\n")
+        uebersicht.schreiben(titel, txt=txt)
+        txt.berichts_info(rep_dates)
+        txt.finalize()
+
+    if 'pdf' in ausgabe:
+        from reportlab.platypus import Paragraph
+        pdf = PDFReport(os.path.join(verzeichnis, "Fakultaet_Uebersicht.pdf"), None,
+                        kopfzeile="Controlling der Fakultät", querformat=True)
+        pdf.append_title2(untertitel)
+        if hinweis:
+            pdf.append(Paragraph(hinweis, pdf.styles['Normal']))
+        uebersicht.schreiben(titel, pdf=pdf)
+        pdf.berichts_info(rep_dates)
+        pdf.finalize()
+
+
+# Berichte für alle IKZ eines fakultätsweiten Datensatzes parallel erzeugen. Fehler bei einer IKZ werden gemeldet,
+# brechen die Erzeugung der übrigen IKZ aber nicht ab. Ein übergebener Prozesspool (z.B. im Überwachungsmodus) wird
+# statt eines neuen genutzt. Rückgabe: Dictionary IKZ -> Fehler
+def batch_berichte_erzeugen(cfg, df, rep_dates, pool=None):
+    with LogContext("Aufteilen des Datensatzes nach IKZ", len(df)) as log:
+        teile = ikz_aufteilen(df)
+        log.zeilen(aus=len(teile))
+
+    if not teile:
+        raise DatensatzFehler("Keine IKZ im Datensatz gefunden! Bitte prüfen!")
+
+    prozesse = min(cfg['batch_prozesse'] or os.cpu_count() or 1, len(teile))
+    print(f"Erzeugung der Berichte für {len(teile)} IKZ mit {prozesse} Prozessen in '{cfg['batch_verzeichnis']}'")
+
+    fehler = dict()
+    zusammenfassungen = dict()
+    with nullcontext(pool) if pool else ProcessPoolExecutor(max_workers=prozesse) as pool:
+        futures = {pool.submit(batch_ikz, cfg, ikz, teil, rep_dates): ikz for ikz, teil in teile.items()}
+        for future in as_completed(futures):
+            ikz = futures[future]
+            try:
+                zusammenfassung = future.result()
+                if zusammenfassung is not None:
+                    zusammenfassungen[ikz] = zusammenfassung
+                print(f"IKZ {ikz}... OK")
+            except Exception as e:
+                fehler[ikz] = e
+                print(f"IKZ {ikz}... FEHLER: {e}")
+
+    if fehler:
+        print(f"\nFür {len(fehler)} von {len(teile)} IKZ konnten keine Berichte erzeugt werden: "
+              f"{', '.join(sorted(fehler))}")
+
+    # Fakultätsübersicht aus den Zusammenfassungen der IKZ (ohne erneute Auswertung)
+    if cfg['fakultaetsbericht'] and zusammenfassungen:
+        with LogContext("Erzeugung der Fakultätsübersicht"):
+            fakultaetsbericht_erzeugen(cfg, zusammenfassungen, df['Jahr'].max(), rep_dates, fehler)
+    return fehler
+
+
+# Bibliotheksschnittstelle ohne Dateien: die vier SAP Exporte (Dictionary stammdaten, budget, obligo, kst und optional
+# detailplot -> Dateipfad, Bytes oder Dateiobjekt) importieren und die Berichte für die IKZ in Puffern erzeugen.
+# cfg: Config (ohne Angabe die Standardwerte; die Pfade der Exporte darin werden nicht genutzt), ausgabe: abweichende
+# Ausgaben wie bei --ausgabe, cache: Import- und Diagrammcache sowie inkrementellen Import wie in der Config nutzen
+# (sonst entstehen keine Dateien, auch kein cache_verzeichnis). Fortschrittsmeldungen entfallen, Warnungen gehen auf
+# stderr. Fehler werden als LSControllingFehler bzw. dessen Unterklassen ausgelöst statt das Programm zu beenden.
+# Rückgabe: Dictionary Dateiname -> io.BytesIO am Anfang (z.B. "123456_Bericht.pdf")
+def berichte_im_speicher(exporte, cfg=None, ausgabe=None, cache=False):
+    cfg = copy.deepcopy(cfg) if cfg else LSControllingConfig()
+    if ausgabe:
+        cfg.setzen('ausgabe', ausgabe)
+    cfg.setzen('prt_raw', False)
+    if not cache:
+        for schluessel in ['import_cache', 'diagramm_cache', 'inkrementell']:
+            cfg.setzen(schluessel, False)
+    if cfg['batch_modus']:
+        raise KonfigurationsFehler("Der Batch-Modus ist für Berichte im Speicher nicht verfügbar")
+    fehlend = [d for d in ['stammdaten', 'budget', 'obligo', 'kst'] if d not in exporte]
+    if fehlend:
+        raise SAPExportFehler(f"Es fehlen die SAP Exporte: {', '.join(fehlend)}")
+
+    ziele = {f: io.BytesIO() for f in sorted(ausgabeformate(cfg['ausgabe']))}
+    aktiv = LogContext.aktiv
+    LogContext.aktiv = False
+    try:
+        with redirect_stdout(sys.stderr):
+            ikz, df_ikz, rep_dates = import_sap_csv_cached(cfg, exporte)
+            berichte_erzeugen(cfg, ikz, df_ikz, rep_dates, ziele=ziele, detailplot=exporte.get('detailplot', ''))
+    finally:
+        LogContext.aktiv = aktiv
+    for puffer in ziele.values():
+        puffer.seek(0)
+    return {ausgabedateien(ikz)[f]: puffer for f, puffer in ziele.items()}
+
+
+# Einen vollständigen Lauf ausführen: Datenimport (oder Übernahme eines vorhandenen Importergebnisses), Ablage in der
+# Historie, Berichte und Messbericht. Rückgabe: Importergebnis (ikz, df_ikz, rep_dates) zur Wiederverwendung, z.B. im
+# Überwachungsmodus
+def lauf(cfg, import_ergebnis=None, pool=None):
+    # Messung und Profilierung vorbereiten (im Batch-Modus liegen die Dateien im batch_verzeichnis)
+    verzeichnis = cfg['batch_verzeichnis'] if cfg['batch_modus'] else '.'
+    if cfg['batch_modus'] and (cfg['messbericht'] or cfg['profil_schritt']):
+        os.makedirs(verzeichnis, exist_ok=True)
+    LogContext.konfigurieren(cfg, os.path.join(verzeichnis, 'Profil.prof'))
+
+    if import_ergebnis is None:
+        # Daten aus SAP importieren
+        with LogContext("Datenimport und -bereinigung") as log:
+            ikz, df_ikz, rep_dates = import_sap_csv_cached(cfg)
+            log.zeilen(aus=len(df_ikz))
+
+        # Ergebnis des Imports in der Historie ablegen (nicht für verfremdete Daten)
+        if cfg['historie'] and not cfg['obfuscated']:
+            from historie import Historie
+            with LogContext("Ablage in der Historie", len(df_ikz)):
+                Historie(cfg['historie']).speichern(df_ikz, rep_dates)
+    else:
+        ikz, df_ikz, rep_dates = import_ergebnis
+
+    # Berichte erzeugen (im Batch-Modus für jede IKZ im Datensatz, ansonsten für die eine IKZ)
+    if cfg['batch_modus']:
+        batch_berichte_erzeugen(cfg, df_ikz, rep_dates, pool)
+    else:
+        berichte_erzeugen(cfg, ikz, df_ikz, rep_dates, pool=pool)
+
+    if cfg['messbericht']:
+        messbericht = os.path.join(verzeichnis, f"{'Batch' if cfg['batch_modus'] else ikz}_Messung."
+                                                f"{cfg['messbericht']}")
+        LogContext.messbericht_schreiben(messbericht)
+        print(f"Messbericht in {messbericht} geschrieben")
+
+    return ikz, df_ikz, rep_dates
+
+
+if __name__ == "__main__":
+    # notwendig für Prozesse im Batch-Modus, wenn das Programm mit PyInstaller kompiliert wurde
+    freeze_support()
+
+    # Kommandozeilenoptionen (haben Vorrang vor der Config-Datei)
+    parser = argparse.ArgumentParser(description="Lehrstuhl-Controlling auf Basis von SAP Berichten")
+    parser.add_argument('--config', default='config.ini', help="Pfad zur Config-Datei (Standard: config.ini)")
+    parser.add_argument('--ausgabe', help="zu erzeugende Ausgaben, kommagetrennt aus txt, pdf, csv "
+                                          "(Standard: alle bzw. Wert aus der Config-Datei)")
+    parser.add_argument('--messbericht', choices=['json', 'csv'],
+                        help="Laufzeiten, CPU-Zeit und Zeilen je Schritt als JSON- oder CSV-Datei neben die Berichte "
+                             "schreiben")
+    parser.add_argument('--profil', help="ersten Schritt, dessen Name so beginnt, mit cProfile profilieren "
+                                         "(z.B. \"Erzeugung der Sub-Berichte\")")
+    parser.add_argument('--ueberwachen', action='store_true',
+                        help="Eingabedateien überwachen und die Berichte bei jedem neuen, vollständigen Satz von SAP "
+                             "Exporten erneut erzeugen (beenden mit Strg+C)")
+    args = parser.parse_args()
+
+    try:
+        # --- Datenimport und Preprocessing ----------------------------------------------------------------------------
+
+        # Prüfen, ob eine Config Datei gegeben wurde; wenn ja, dann Werte aus Config nutzen, ansonsten Default Werte
+        cfg = LSControllingConfig(args.config)
+        if args.ausgabe:
+            cfg.setzen('ausgabe', args.ausgabe)
+        if args.messbericht:
+            cfg.setzen('messbericht', args.messbericht)
+        if args.profil:
+            cfg.setzen('profil_schritt', args.profil)
+        ausgabeformate(cfg['ausgabe'])  # Angabe frühzeitig prüfen
+        if cfg['messbericht'] not in ('', 'json', 'csv'):
+            raise KonfigurationsFehler(f"Unbekanntes Format für den Messbericht: {cfg['messbericht']}. Erlaubt sind: "
+                                       f"json, csv")
+
+        if args.ueberwachen:
+            from ueberwachung import ueberwachen
+            ueberwachen(cfg, lauf)
+        else:
+            lauf(cfg)
 
     except Exception as e:
         print(f"FEHLER: {e}\n")
@@ -0,0 +1,155 @@
+import argparse
+import os
+import random
+from datetime import date, timedelta
+
+# Erzeugung synthetischer SAP Exporte (Stammdaten, Budget, Obligo und Drittmittelkontostand) im Aufbau, den
+# import_sap_csv erwartet: Kopfzeilen mit Berichtsname und Erstelldatum, Semikolon als Trennzeichen, deutsche Zahlen
+# mit Tausenderpunkt und Dezimalkomma sowie Ergebnis- und Gesamtergebniszeilen. Die Dateien dienen zum Testen und zur
+# Leistungsmessung (siehe benchmark.py) und enthalten keine echten Daten.
+
+# Dateinamen wie beim Export aus dem SAP Berichtsportal (siehe readme.md)
+dateinamen = {
+    'stammdaten': 'WPS_PSP_STAMMDATEN_V1.csv',
+    'budget': 'WFI_001_FC_BUDGET_V1.csv',
+    'obligo': 'WFI_001_FC_OBLIGOS_V1.csv',
+    'kst': 'WPSM_004_KSD.csv'
+}
+
+# Projektarten mit Drittmittelkontostand (alle anderen werden nur über das Budget geführt)
+projektarten_dm = [68, 69, 90, 91, 92, 99]
+projektarten_budget = [70, 77, 94]
+
+# Geldgeber, 999 und 1 kennzeichnen Sammelkonten
+geldgeber = ['999', '1', '12', '30', '31', '45', '60']
+status = ['freigegeben', 'freigegeben', 'freigegeben', 'teilabgeschlossen', 'beendet']
+
+
+# Betrag im SAP Format (z.B. -1.234,56)
+def sap_betrag(wert):
+    return f"{wert:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+
+
+# Zufällige Projekte erzeugen: PSP-Element (400 + PA + IKZ + laufende Nummer), Name, Status, Laufzeit und Geldgeber
+def projekte_erzeugen(rnd, anzahl_psp, ikz_liste, erstes_jahr, letztes_jahr):
+    if anzahl_psp > 10000 * len(ikz_liste):
+        raise ValueError(f"Maximal 10000 PSP-Elemente je IKZ möglich ({anzahl_psp} für {len(ikz_liste)} IKZ)")
+
+    projekte = []
+    for nummer in range(anzahl_psp):
+        ikz = ikz_liste[nummer % len(ikz_liste)]
+        pa = rnd.choice(projektarten_dm + projektarten_budget)
+        psp = f"400{pa}{ikz}{nummer // len(ikz_liste):04d}"
+        beginn = rnd.randint(erstes_jahr, letztes_jahr)
+        ende = date(beginn, 1, 1) + timedelta(days=rnd.randint(365, 6 * 365))
+        projekte.append({
+            'psp': psp,
+            'name': f"Projekt {nummer} IKZ {ikz}",
+            'status': rnd.choice(status),
+            'beginn': beginn,
+            'ende': ende,
+            'geldgeber': rnd.choice(geldgeber),
+            'dm': pa in projektarten_dm,
+            'volumen': rnd.uniform(2e4, 5e5)
+        })
+    return projekte
+
+
+def stammdaten_schreiben(f, projekte, erstellt):
+    f.write(f";Stammdaten HHP;\n;{erstellt}\n")
+    f.write("Finanzstelle;Bezeichnung;Status;PSP-Element;Bezeichnung;Verantwortlicher;Beginn;Ende;Fonds;Typ;"
+            "Geldgeber\n")
+    for p in projekte:
+        f.write(f"F{p['psp'][5:11]};Finanzstelle {p['psp'][5:11]};{p['status']};{p['psp']};{p['name']};N.N.;"
+                f"01.01.{p['beginn']};{p['ende'].strftime('%d.%m.%Y')};X;Y;{p['geldgeber']}\n")
+
+
+def budget_schreiben(f, rnd, projekte, jahre, erstellt):
+    f.write(f";Budget;\n;{erstellt}\n;Finanzstelle: alle Werte\n")
+    f.write("PSP-Element;Bezeichnung;Geschäftsjahr;Finanzposition;Fonds;Finanzstelle;Art;Budgetrest aus Vorjahr;"
+            "Originalbudget;Sonstige Zuweisungen\n")
+    gesamt = 0
+    for p in projekte:
+        rest = 0
+        for jahr in [j for j in jahre if j >= p['beginn']]:
+            # je Jahr ein bis drei Finanzpositionen und eine Ergebniszeile
+            summe = 0
+            for position in range(rnd.randint(1, 3)):
+                original = p['volumen'] / 5 * rnd.uniform(0.5, 1.5) if jahr <= p['ende'].year else 0
+                sonstige = rnd.uniform(-2e3, 1e4) if rnd.random() < 0.3 else None
+                vorjahr = rest * rnd.uniform(0.2, 0.6)
+                summe += vorjahr + original + (sonstige or 0)
+                f.write(f"{p['psp']};{p['name']};{jahr};{position + 1}00000;X;F{p['psp'][5:11]};Budget;"
+                        f"{sap_betrag(vorjahr)};{sap_betrag(original)};"
+                        f"{sap_betrag(sonstige) if sonstige is not None else ''}\n")
+            f.write(f"{p['psp']};{p['name']};{jahr};;;;Ergebnis;;{sap_betrag(summe)};\n")
+            rest = summe * rnd.uniform(0.1, 0.9)
+            gesamt += summe
+    f.write(f";;;;;;Gesamtergebnis;;{sap_betrag(gesamt)};\n")
+
+
+def obligo_schreiben(f, rnd, projekte, jahre, erstellt):
+    f.write(f";Obligos;\n;{erstellt}\n;Jahr: alle Werte\n")
+    f.write("Jahr;Belegart;Belegnummer;PSP-Element;Bezeichnung;Finanzposition;Text;Betrag\n")
+    for p in projekte:
+        for jahr in [j for j in jahre if p['beginn'] <= j <= p['ende'].year]:
+            for beleg in range(rnd.choice([0, 0, 1, 2])):
+                f.write(f"{jahr};BE;{rnd.randint(4500000000, 4599999999)};{p['psp']};{p['name']};"
+                        f"{rnd.randint(1, 9)}00000;Bestellung;{sap_betrag(rnd.uniform(100, p['volumen'] / 20))}\n")
+
+
+def kontostand_schreiben(f, rnd, projekte, jahre, erstellt):
+    f.write(f";Kontostand;\n;{erstellt}\n;Finanzstelle: alle Werte\n")
+    f.write("PSP-Element;Bezeichnung;Geschäftsjahr;Einnahmen ILA;Einnahmen-Ist;Eigen- und Industrieanteile;"
+            "Ausgaben-Ist;Kontostand Jahr\n")
+    gesamt = [0] * 5
+    for p in [p for p in projekte if p['dm']]:
+        summe = [0] * 5
+        for jahr in [j for j in jahre if j >= p['beginn']]:
+            ila = rnd.uniform(0, p['volumen'] / 50)
+            einnahmen = p['volumen'] / 5 * rnd.uniform(0.5, 1.5) if jahr <= p['ende'].year else 0
+            eigen = rnd.uniform(0, 5e3) if rnd.random() < 0.2 else 0
+            ausgaben = -einnahmen * rnd.uniform(0.7, 1.2)
+            werte = [ila, einnahmen, eigen, ausgaben, ila + einnahmen + eigen + ausgaben]
+            summe = [s + w for s, w in zip(summe, werte)]
+            f.write(f"{p['psp']};{p['name']};{jahr};" + ";".join(sap_betrag(w) for w in werte) + "\n")
+        f.write(f"{p['psp']};{p['name']};Ergebnis;" + ";".join(sap_betrag(s) for s in summe) + "\n")
+        gesamt = [g + s for g, s in zip(gesamt, summe)]
+    f.write("Gesamtergebnis;;;" + ";".join(sap_betrag(g) for g in gesamt) + "\n")
+
+
+# Alle vier SAP Exporte in das Verzeichnis schreiben (Dateinamen wie in der Standardkonfiguration, d.h. das
+# Verzeichnis kann direkt als Ordner 'input' genutzt werden). Rückgabe: Dictionary Datentyp -> Dateipfad
+def sap_exporte_erzeugen(verzeichnis, anzahl_psp=500, anzahl_jahre=15, anzahl_ikz=1, letztes_jahr=None, seed=1):
+    rnd = random.Random(seed)
+    letztes_jahr = letztes_jahr or date.today().year
+    jahre = list(range(letztes_jahr - anzahl_jahre + 1, letztes_jahr + 1))
+    ikz_liste = [f"{123456 + 1111 * i:06d}" for i in range(anzahl_ikz)]
+    projekte = projekte_erzeugen(rnd, anzahl_psp, ikz_liste, jahre[0], letztes_jahr)
+    erstellt = date.today().strftime('%d.%m.%Y')
+
+    os.makedirs(verzeichnis, exist_ok=True)
+    pfade = {d: os.path.join(verzeichnis, name) for d, name in dateinamen.items()}
+    with open(pfade['stammdaten'], 'w', encoding='utf-8') as f:
+        stammdaten_schreiben(f, projekte, erstellt)
+    with open(pfade['budget'], 'w', encoding='utf-8') as f:
+        budget_schreiben(f, rnd, projekte, jahre, erstellt)
+    with open(pfade['obligo'], 'w', encoding='utf-8') as f:
+        obligo_schreiben(f, rnd, projekte, jahre, erstellt)
+    with open(pfade['kst'], 'w', encoding='utf-8') as f:
+        kontostand_schreiben(f, rnd, projekte, jahre, erstellt)
+    return pfade
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetische SAP Exporte für LSControlling erzeugen")
+    parser.add_argument('verzeichnis', nargs='?', default='input', help="Zielverzeichnis (Standard: input)")
+    parser.add_argument('--psp', type=int, default=500, help="Anzahl der PSP-Elemente (Standard: 500)")
+    parser.add_argument('--jahre', type=int, default=15, help="Anzahl der Jahre (Standard: 15)")
+    parser.add_argument('--ikz', type=int, default=1, help="Anzahl der IKZ (Standard: 1, mehr für den Batch-Modus)")
+    parser.add_argument('--bis', type=int, default=None, help="letztes Jahr (Standard: aktuelles Jahr)")
+    parser.add_argument('--seed', type=int, default=1, help="Startwert des Zufallsgenerators (Standard: 1)")
+    args = parser.parse_args()
+
+    for d, pfad in sap_exporte_erzeugen(args.verzeichnis, args.psp, args.jahre, args.ikz, args.bis, args.seed).items():
+        print(f"{d}: {pfad} ({os.path.getsize(pfad) / 1024:.0f} kB)")
@@ -0,0 +1,148 @@
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from funktionen import LSControllingConfig, ausgabeformate, check_sap_header, import_cache_schluessel
+
+# Überwachungsmodus: die SAP Exporte im Eingabeverzeichnis werden regelmäßig geprüft und die Berichte erneut erzeugt,
+# sobald ein neuer, vollständiger und konsistenter Satz der vier Exporte vorliegt. Das Programm läuft dabei weiter,
+# d.h. Python, pandas, matplotlib und reportlab sind bereits geladen, der Prozesspool für Diagramme bzw. IKZ bleibt
+# bestehen und das letzte Importergebnis wird im Speicher gehalten. Mehrere Änderungen kurz hintereinander (z.B. beim
+# Kopieren der vier Dateien) werden zu einem Lauf zusammengefasst.
+
+quellen = ['stammdaten', 'budget', 'obligo', 'kst']
+
+
+# Stand einer Datei als (Größe, Änderungszeit in ns); None, wenn die Datei fehlt
+def dateistand(pfad):
+    try:
+        st = os.stat(pfad)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class Ueberwachung:
+    def __init__(self, config: LSControllingConfig):
+        self.config = config
+        self.intervall = max(float(config['ueberwachung_intervall']), 0.1)
+        self.ruhezeit = float(config['ueberwachung_ruhezeit'])
+        self.max_tage = int(config['ueberwachung_max_tage'])
+        # die Detailplot-Datei ist optional, Änderungen lösen aber ebenfalls neue Berichte aus
+        self.pfade = {d: config[f'csv_{d}'] for d in quellen + ['detailplot']}
+        self.stand = None  # zuletzt gesehener Stand aller Dateien
+        self.seit = None  # Zeitpunkt, seit dem dieser Stand unverändert ist
+        self.verarbeitet = None  # Stand beim letzten Lauf
+        self.meldung = None
+
+    def staende(self):
+        return {d: dateistand(p) for d, p in self.pfade.items()}
+
+    # Meldung nur ausgeben, wenn sie sich gegenüber der letzten geändert hat (sonst bei jeder Prüfung)
+    def melden(self, meldung):
+        if meldung != self.meldung:
+            print(meldung)
+            self.meldung = meldung
+
+    # Prüfen, ob die vier Exporte vollständig und konsistent sind: alle vorhanden und lesbar, mit den erwarteten
+    # Kopfzeilen (sofern die Prüfung nicht abgeschaltet ist) und mit Erstelldaten, die höchstens max_tage auseinander
+    # liegen (sonst fehlt vermutlich noch ein neuer Export). Rückgabe: None, wenn ja, ansonsten der Grund als Text
+    def unvollstaendig(self):
+        fehlend = [os.path.basename(self.pfade[d]) for d in quellen if not self.stand[d] or not self.stand[d][0]]
+        if fehlend:
+            return f"fehlend oder leer: {', '.join(fehlend)}"
+
+        erstellt = dict()
+        for d in quellen:
+            try:
+                with open(self.pfade[d], 'r', newline='', encoding='utf-8') as f:
+                    zeilen = [f.readline(), f.readline()]
+                if self.config[f'check_{d}']:
+                    check_sap_header(zeilen, self.pfade[d], d)
+                    datum = re.search(r'\d{2}\.\d{2}\.\d{4}', zeilen[1])
+                    if datum:
+                        erstellt[d] = datetime.strptime(datum.group(), '%d.%m.%Y')
+            except Exception as e:
+                return f"{os.path.basename(self.pfade[d])} nicht nutzbar: {e}"
+
+        if erstellt and (max(erstellt.values()) - min(erstellt.values())).days > self.max_tage:
+            return (f"Erstelldaten liegen mehr als {self.max_tage} Tage auseinander: " +
+                    ", ".join(f"{d} {e.strftime('%d.%m.%Y')}" for d, e in erstellt.items()))
+        return None
+
+    # Warten, bis ein neuer Satz von Exporten vorliegt, der seit ruhezeit Sekunden unverändert ist. Rückgabe: Stand der
+    # Dateien, der nach dem Lauf als verarbeitet gemerkt wird
+    def warten(self):
+        while True:
+            stand = self.staende()
+            jetzt = time.time()
+            if stand != self.stand:
+                # beim Start zählen Dateien, die schon länger unverändert sind, sofort als ruhig
+                juengste = max((s[1] / 1e9 for s in stand.values() if s), default=jetzt)
+                self.seit = jetzt if self.stand is not None else min(juengste, jetzt)
+                self.stand = stand
+            elif stand != self.verarbeitet and jetzt - self.seit >= self.ruhezeit:
+                grund = self.unvollstaendig()
+                if grund is None:
+                    self.meldung = None
+                    return stand
+                self.melden(f"Warte auf einen vollständigen Satz von SAP Exporten ({grund})")
+            time.sleep(self.intervall)
+
+
+# Prozesspool, der über alle Läufe bestehen bleibt: im Batch-Modus für die IKZ, sonst für die matplotlib Diagramme im
+# PDF (None, wenn kein Pool benötigt wird)
+def warmer_pool(config: LSControllingConfig):
+    if config['batch_modus']:
+        return ProcessPoolExecutor(max_workers=config['batch_prozesse'] or os.cpu_count() or 1)
+    if 'pdf' in ausgabeformate(config['ausgabe']) and config['diagramm_backend'] == 'matplotlib' and \
+            config['parallel_prozesse'] != 1:
+        return ProcessPoolExecutor(max_workers=config['parallel_prozesse'] or os.cpu_count() or 1)
+    return None
+
+
+# Eingabedateien überwachen und für jeden neuen Satz von Exporten lauf(config, import_ergebnis, pool) ausführen (siehe
+# lscontrolling.lauf). Sind nur die Zeitstempel neu, die Inhalte aber unverändert, entfällt der Lauf; hat sich nur die
+# Detailplot-Datei geändert, wird das Importergebnis aus dem Speicher wiederverwendet. Fehler in einem Lauf werden
+# gemeldet, die Überwachung läuft weiter. Beenden mit Strg+C.
+def ueberwachen(config: LSControllingConfig, lauf):
+    ueberwachung = Ueberwachung(config)
+    print(f"Überwache die SAP Exporte in '{os.path.dirname(os.path.abspath(ueberwachung.pfade['stammdaten']))}' "
+          f"(Ruhezeit {ueberwachung.ruhezeit:g} s, beenden mit Strg+C)")
+
+    import_ergebnis = None
+    inhalt = None
+    pool = None
+    try:
+        while True:
+            stand = ueberwachung.warten()
+            schluessel = import_cache_schluessel(config)
+            if schluessel is not None and schluessel == inhalt and \
+                    stand['detailplot'] == (ueberwachung.verarbeitet or {}).get('detailplot'):
+                print(f"{datetime.now().strftime('%H:%M:%S')} Inhalte der SAP Exporte unverändert, Berichte aktuell")
+                ueberwachung.verarbeitet = stand
+                continue
+
+            print(f"\n{datetime.now().strftime('%H:%M:%S')} Neuer Satz von SAP Exporten, Berichte werden erzeugt")
+            start = time.time()
+            pool = pool or warmer_pool(config)
+            try:
+                import_ergebnis = lauf(config, import_ergebnis if schluessel is not None and schluessel == inhalt
+                                       else None, pool)
+                inhalt = schluessel
+                print(f"Lauf abgeschlossen ({time.time() - start:.1f} s)")
+            except BrokenProcessPool as e:
+                # Pool beim nächsten Lauf neu starten
+                print(f"FEHLER: {e}")
+                pool.shutdown(wait=False)
+                pool = None
+            except Exception as e:
+                print(f"FEHLER: {e}")
+            ueberwachung.verarbeitet = stand
+    except KeyboardInterrupt:
+        print("\nÜberwachung beendet.")
+    finally:
+        if pool:
+            pool.shutdown()